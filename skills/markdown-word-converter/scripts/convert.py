@@ -8,57 +8,991 @@ import subprocess
 import sys
 import argparse
 import platform
+import atexit
+import base64
+import contextlib
+import functools
+import glob
+import hashlib
+import html
+import json
+import logging
+import logging.handlers
+import mmap
+import os
+import queue
+import re
+import shutil
+import tempfile
+import threading
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 
+__all__ = [
+    'MermaidWorker',
+    'MermaidWorkerPool',
+    'check_dependencies',
+    'convert',
+    'convert_combined',
+    'convert_many',
+    'convert_mermaid',
+    'convert_to_docx',
+    'convert_to_docx_python',
+    'convert_to_docx_variants',
+    'expand_inputs',
+    'has_mermaid_diagrams',
+    'main',
+    'prepare_markdown',
+    'prerender_mermaid',
+    'test_mmdc',
+    'write_docx',
+]
+
+
+logger = logging.getLogger(__name__)
+
+
+class _MaxLevelFilter(logging.Filter):
+    def __init__(self, max_level):
+        super().__init__()
+        self.max_level = max_level
+
+    def filter(self, record):
+        return record.levelno <= self.max_level
+
+
+def configure_logging(verbose=False, parallel=False):
+    """命令行输出：普通信息写 stdout，警告和错误写 stderr；--verbose 时输出每一步的细节
+
+    并行转换时各线程只把日志放进队列，由单独的监听线程统一写出，避免争用输出流的锁。
+    返回需要在结束时 stop() 的 QueueListener（非并行时为 None）
+    """
+    formatter = logging.Formatter('%(message)s')
+    stdout_handler = logging.StreamHandler(sys.stdout)
+    stdout_handler.addFilter(_MaxLevelFilter(logging.INFO))
+    stderr_handler = logging.StreamHandler(sys.stderr)
+    stderr_handler.setLevel(logging.WARNING)
+    handlers = [stdout_handler, stderr_handler]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    logger.setLevel(logging.DEBUG if verbose else logging.INFO)
+    logger.propagate = False
+    logger.handlers.clear()
+
+    if not parallel:
+        for handler in handlers:
+            logger.addHandler(handler)
+        return None
+
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+def _locked_cache(maxsize=None):
+    """带锁的 lru_cache：并发转换时多个线程同时首次调用，也只计算一次"""
+    def decorator(func):
+        cached = functools.lru_cache(maxsize=maxsize)(func)
+        lock = threading.Lock()
+
+        @functools.wraps(func)
+        def wrapper(*args):
+            with lock:
+                return cached(*args)
+
+        wrapper.cache_clear = cached.cache_clear
+        return wrapper
+    return decorator
+
+
+def _is_intermediate(path):
+    # --keep-intermediate 留下的 <name>.mmdc.md 不是用户的输入
+    return str(path).lower().endswith('.mmdc.md')
+
+
+def expand_inputs(patterns):
+    """展开输入参数：目录取其中的 .md 文件，通配符按 glob 展开（均跳过 *.mmdc.md 中间文件）"""
+    input_files = []
+    for pattern in patterns:
+        if Path(pattern).is_dir():
+            matches = (str(p) for p in Path(pattern).glob('*.md'))
+        elif glob.has_magic(pattern):
+            matches = glob.glob(pattern)
+        else:
+            input_files.append(pattern)
+            continue
+        input_files.extend(sorted(p for p in matches if not _is_intermediate(p)))
+    return input_files
+
+
+@contextlib.contextmanager
+def _mapped(path):
+    """以只读 mmap 打开文件；空文件无法映射，返回空字节串"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b''
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield mm
+
+
+@functools.lru_cache(maxsize=256)
+def _scan_mermaid(path, mtime_ns, size):
+    # 直接在映射的字节上查找，无需整篇读入和解码；mtime/size 作为缓存键的一部分。
+    # 先用 find 快速排除，再从该行起用正则确认确实有完整的代码块（而不只是行内提到 ```mermaid）
+    with _mapped(path) as data:
+        start = data.find(b'```mermaid')
+        if start == -1:
+            return False
+        return _MERMAID_BLOCK_BYTES_RE.search(data, data.rfind(b'\n', 0, start) + 1) is not None
+
+
 def has_mermaid_diagrams(input_file):
-    """检查文件是否包含 mermaid 代码块"""
+    """检查文件是否包含 mermaid 代码块（在 mmap 映射的字节上查找，不整篇读入或解码）"""
     try:
-        with open(input_file, 'r', encoding='utf-8') as f:
-            content = f.read()
-            return '```mermaid' in content
-    except Exception as e:
+        st = os.stat(input_file)
+        return _scan_mermaid(os.path.abspath(input_file), st.st_mtime_ns, st.st_size)
+    except OSError as e:
         raise RuntimeError(f"读取文件失败: {e}")
 
 
-def convert_mermaid(input_file, output_file):
-    """第一步：使用 mmdc 转换 mermaid 图表"""
-    mmdc_cmd = 'mmdc.cmd' if platform.system() == 'Windows' else 'mmdc'
-    cmd = [mmdc_cmd, '-i', str(input_file), '-o', str(output_file), '-e', 'png', '-s', '2']
+MERMAID_SERVER_JS = Path(__file__).resolve().parent / 'mmdc_server.mjs'
+
+# 标题少于该数量的文档不生成目录
+TOC_MIN_HEADINGS = 3
+
+# ATX 标题（# 标题）与 Setext 标题（下一行是 === 或 ---）
+_HEADING_RE = re.compile(rb'^(?:#{1,6}[ \t]|[ \t]{0,3}\S[^\n]*\r?\n[ \t]{0,3}(?:=+|-+)[ \t]*\r?$)', re.MULTILINE)
+_FENCED_CODE_RE = re.compile(rb'^```.*?^```', re.MULTILINE | re.DOTALL)
+
+# 同时运行的常驻渲染进程（浏览器）数量上限
+MERMAID_WORKERS = min(4, os.cpu_count() or 1)
+
+MERMAID_INK_URL = 'https://mermaid.ink/img/{}?type=png'
 
+CACHE_DIR = Path(os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache') / 'md2docx'
+
+MERMAID_CACHE_DIR = CACHE_DIR / 'mermaid'
+
+# 开始和结束围栏都必须独占一行，允许缩进（例如位于列表项中）
+_MERMAID_BLOCK_RE = re.compile(
+    r"^(?P<indent>[ \t]*)```mermaid[ \t]*\r?\n(?P<source>.*?)^[ \t]*```[ \t]*\r?$",
+    re.MULTILINE | re.DOTALL
+)
+_MERMAID_BLOCK_BYTES_RE = re.compile(_MERMAID_BLOCK_RE.pattern.encode('ascii'), re.MULTILINE | re.DOTALL)
+# mmdc --version 的输出和 ~/.npmrc 都只解析一遍，不逐行 split
+_VERSION_RE = re.compile(r'(\d+)\.(\d+)\.(\d+)')
+_NPMRC_PREFIX_RE = re.compile(r'^[ \t]*prefix[ \t]*=[ \t]*(.+?)[ \t]*$', re.MULTILINE)
+
+
+def _block_source(match):
+    """取出图表源码，并去掉与开始围栏相同的缩进
+
+    行尾空白和首尾空行不影响渲染结果，一并去掉，只差这些的图表共用同一个缓存键
+    """
+    indent = match.group('indent')
+    lines = match.group('source').splitlines()
+    if indent:
+        lines = [line[len(indent):] if line.startswith(indent) else line.lstrip() for line in lines]
+    return '\n'.join(line.rstrip() for line in lines).strip('\n')
+
+
+def _mmdc_command():
+    return 'mmdc.cmd' if platform.system() == 'Windows' else 'mmdc'
+
+
+@functools.lru_cache(maxsize=1)
+def _npm_prefix():
+    """按 npm 自身的规则推算全局安装前缀，不启动 npm（在 Windows 上要启动两次 node）
+
+    依次取 npm_config_prefix 环境变量、~/.npmrc 中的 prefix=；
+    默认值在 Windows 上为 %APPDATA%\\npm，其他系统为 node 所在目录的上一级
+    """
+    for name in ('npm_config_prefix', 'NPM_CONFIG_PREFIX'):
+        if os.environ.get(name):
+            return Path(os.path.expanduser(os.environ[name]))
+    with contextlib.suppress(OSError, UnicodeDecodeError):
+        text = (Path.home() / '.npmrc').read_text(encoding='utf-8')
+        match = _NPMRC_PREFIX_RE.search(text)
+        if match:
+            return Path(os.path.expanduser(match.group(1).strip('"\'')))
+    if platform.system() == 'Windows':
+        return Path(os.environ['APPDATA']) / 'npm' if os.environ.get('APPDATA') else None
+    node = shutil.which('node')
+    return Path(node).resolve().parent.parent if node else None
+
+
+def _scan_dir(directory):
+    """一次列出目录中的条目 {名称: DirEntry}，目录不存在时为空
+
+    DirEntry 自带文件类型，逐个判断候选文件时不必再各自 stat
+    """
     try:
-        subprocess.run(cmd, check=True, capture_output=True, text=True)
-        print(f"✓ Mermaid 图表已转换: {output_file}")
+        with os.scandir(directory) as entries:
+            return {entry.name: entry for entry in entries}
+    except OSError:
+        return {}
+
+
+def _which_in(directory, names):
+    """在单个目录中查找可执行文件（按 names 的顺序）"""
+    entries = _scan_dir(directory)
+    for name in names:
+        entry = entries.get(name)
+        if entry is not None and entry.is_file() and os.access(entry.path, os.X_OK):
+            return entry.path
+    return None
+
+
+def _npm_bin_dir():
+    prefix = _npm_prefix()
+    if prefix is None:
+        return None
+    return prefix if platform.system() == 'Windows' else prefix / 'bin'
+
+
+def _npm_modules_dir():
+    """npm 全局包目录：Windows 为 <prefix>\\node_modules，其他系统为 <prefix>/lib/node_modules"""
+    prefix = _npm_prefix()
+    if prefix is None:
+        return None
+    return prefix / 'node_modules' if platform.system() == 'Windows' else prefix / 'lib' / 'node_modules'
+
+
+@_locked_cache(maxsize=1)
+def check_dependencies():
+    """查找 pandoc、mmdc 和 node，返回 {工具名: 路径或 None}；整个进程只查找一次
+
+    mmdc 不在 PATH 中时，再到 npm 全局安装目录中查找
+    """
+    mmdc = shutil.which(_mmdc_command())
+    if mmdc is None and _npm_bin_dir() is not None:
+        mmdc = _which_in(_npm_bin_dir(), (_mmdc_command(),))
+    return {
+        'pandoc': shutil.which('pandoc'),
+        'mmdc': mmdc,
+        'node': shutil.which('node'),
+    }
+
+
+def _executable(name):
+    """返回工具的绝对路径（避免每次启动子进程都重新搜索 PATH），找不到时原样返回"""
+    command = _mmdc_command() if name == 'mmdc' else name
+    return check_dependencies()[name] or command
+
+
+def _find_mermaid_cli_dir(mmdc_path):
+    """根据 mmdc 可执行文件位置推断 @mermaid-js/mermaid-cli 的安装目录"""
+    mmdc_path = Path(mmdc_path)
+    # Linux/macOS: bin/mmdc 是指向 node_modules/@mermaid-js/mermaid-cli/src/cli.js 的链接
+    for parent in mmdc_path.resolve().parents:
+        if parent.name == 'mermaid-cli' and (parent / 'package.json').exists():
+            return parent
+    # Windows: mmdc.cmd 与 node_modules 位于同一目录；Unix 全局安装位于 lib/node_modules；
+    # 最后按 npm 全局前缀直接定位（不调用 npm list -g，它会遍历整个全局 node_modules）
+    modules_dirs = [mmdc_path.parent / 'node_modules', mmdc_path.parent.parent / 'lib' / 'node_modules']
+    if _npm_modules_dir() is not None:
+        modules_dirs.append(_npm_modules_dir())
+    for modules_dir in modules_dirs:
+        entry = _scan_dir(modules_dir / '@mermaid-js').get('mermaid-cli')
+        if entry is not None and entry.is_dir() and 'package.json' in _scan_dir(entry.path):
+            return Path(entry.path)
+    return None
+
+
+def _mmdc_invocation():
+    """调用 mmdc 的命令前缀（mmdc 未安装时为 None）
+
+    Windows 上 mmdc.cmd 要先经过 cmd.exe 再启动 node；找得到 mermaid-cli 时直接用 node 运行 src/cli.js。
+    与 npm 生成的 .cmd 一样，优先使用同目录下的 node.exe
+    """
+    mmdc_path = check_dependencies()['mmdc']
+    if mmdc_path is None:
+        return None
+    if platform.system() == 'Windows':
+        cli_dir = _find_mermaid_cli_dir(mmdc_path)
+        node = _which_in(Path(mmdc_path).parent, ('node.exe',)) or check_dependencies().get('node')
+        if cli_dir is not None and node is not None and (cli_dir / 'src' / 'cli.js').is_file():
+            return [node, str(cli_dir / 'src' / 'cli.js')]
+    return [mmdc_path]
+
+
+class MermaidWorker:
+    """常驻的 mermaid 渲染进程（见 mmdc_server.mjs），只启动一次 Node + 浏览器"""
+
+    def __init__(self, mmdc_path):
+        node = check_dependencies().get('node')
+        cli_dir = _find_mermaid_cli_dir(mmdc_path)
+        if node is None or cli_dir is None:
+            raise RuntimeError("未找到 node 或 mermaid-cli 安装目录")
+
+        self._lock = threading.Lock()
+        self._proc = subprocess.Popen(
+            [node, str(MERMAID_SERVER_JS), str(cli_dir), json.dumps(_chromium_args())],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            text=True, encoding='utf-8', bufsize=1
+        )
+        status = self._read_reply()
+        if not status.get('ready'):
+            self.close()
+            raise RuntimeError(f"mermaid 渲染进程启动失败: {status.get('error', '未知错误')}")
+
+    def _read_reply(self):
+        line = self._proc.stdout.readline()
+        if not line:
+            return {'ok': False, 'error': '渲染进程已退出'}
+        return json.loads(line)
+
+    def alive(self):
+        return self._proc.poll() is None
+
+    def render(self, source, output_png):
+        """把一段 mermaid 源码渲染为 PNG"""
+        request = json.dumps({'source': source, 'output': str(output_png)})
+        try:
+            with self._lock:
+                self._proc.stdin.write(request + '\n')
+                self._proc.stdin.flush()
+                result = self._read_reply()
+        except (OSError, ValueError) as e:
+            # 进程已退出（管道断开）或输出了无法解析的内容
+            raise RuntimeError(f"mermaid 渲染进程通信失败: {e}") from e
+        if not result.get('ok'):
+            raise RuntimeError(f"mermaid 图表渲染失败:\n{result.get('error')}")
+
+    def close(self):
+        if self._proc.poll() is None:
+            with contextlib.suppress(OSError):
+                self._proc.stdin.close()
+            try:
+                self._proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self._proc.kill()
+
+
+class MermaidWorkerPool:
+    """最多 size 个常驻渲染进程，按需启动，用完放回供其他线程复用"""
+
+    def __init__(self, mmdc_path, size):
+        self._mmdc_path = mmdc_path
+        self._slots = threading.Semaphore(size)
+        self._idle = queue.LifoQueue()
+        self._workers = []
+        self._workers_lock = threading.Lock()
+        # 先启动一个进程，确认当前环境能用常驻渲染
+        self._idle.put(self._spawn())
+
+    def _spawn(self):
+        worker = MermaidWorker(self._mmdc_path)
+        with self._workers_lock:
+            self._workers.append(worker)
+        return worker
+
+    def _discard(self, worker):
+        worker.close()
+        with self._workers_lock:
+            if worker in self._workers:
+                self._workers.remove(worker)
+
+    def _checkout(self):
+        """取一个存活的空闲进程；没有则启动新进程，启动失败时等待已有进程空闲"""
+        can_spawn = True
+        while True:
+            try:
+                worker = self._idle.get_nowait() if can_spawn else self._idle.get(timeout=0.5)
+            except queue.Empty:
+                if can_spawn:
+                    try:
+                        return self._spawn()
+                    except (OSError, ValueError, RuntimeError):
+                        can_spawn = False
+                with self._workers_lock:
+                    if not any(w.alive() for w in self._workers):
+                        raise RuntimeError("没有可用的 mermaid 渲染进程")
+                continue
+            if worker.alive():
+                return worker
+            self._discard(worker)
+
+    @contextlib.contextmanager
+    def acquire(self):
+        with self._slots:
+            worker = self._checkout()
+            try:
+                yield worker
+            finally:
+                if worker.alive():
+                    self._idle.put(worker)
+                else:
+                    self._discard(worker)
+
+    def close(self):
+        with self._workers_lock:
+            workers = list(self._workers)
+        for worker in workers:
+            worker.close()
+
+
+_pool_lock = threading.Lock()
+_pool = None
+_pool_failed = False
+
+
+def _get_mermaid_pool():
+    """惰性启动常驻渲染进程池；无法启动时返回 None，退回调用 mmdc"""
+    global _pool, _pool_failed
+    with _pool_lock:
+        if _pool is None and not _pool_failed:
+            mmdc_path = check_dependencies()['mmdc']
+            try:
+                if mmdc_path is None:
+                    raise RuntimeError("mmdc 未安装")
+                _pool = MermaidWorkerPool(mmdc_path, MERMAID_WORKERS)
+                atexit.register(_pool.close)
+            except (OSError, ValueError, RuntimeError):
+                _pool_failed = True
+        return _pool
+
+
+def _chromium_args():
+    """加快 Chromium 启动的参数；root 用户下 Chromium 必须关闭沙箱才能启动"""
+    args = ['--disable-dev-shm-usage']
+    if hasattr(os, 'geteuid') and os.geteuid() == 0:
+        args.append('--no-sandbox')
+    return args
+
+
+@_locked_cache(maxsize=1)
+def mmdc_version():
+    """mmdc 版本号元组（无法识别时为 None）
+
+    结果按 mmdc 实际路径和 mtime 缓存在 CACHE_DIR/deps.json，mmdc 不变时不再为此启动 Node
+    """
+    mmdc_path = check_dependencies()['mmdc']
+    if mmdc_path is None:
+        return None
+
+    deps_file = CACHE_DIR / 'deps.json'
+    real_path = os.path.realpath(mmdc_path)
+    try:
+        mtime_ns = os.stat(real_path).st_mtime_ns
+    except OSError:
+        mtime_ns = None
+    with contextlib.suppress(OSError, ValueError, AttributeError):
+        cached = json.loads(deps_file.read_text(encoding='utf-8')).get('mmdc', {})
+        if mtime_ns is not None and cached.get('path') == real_path and cached.get('mtime_ns') == mtime_ns:
+            return tuple(cached['version']) if cached.get('version') else None
+
+    try:
+        output = subprocess.run([*_mmdc_invocation(), '--version'], capture_output=True, text=True,
+                                timeout=30).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    match = _VERSION_RE.search(output)
+    version = tuple(int(part) for part in match.groups()) if match else None
+
+    if mtime_ns is not None:
+        with contextlib.suppress(OSError):
+            CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            deps_file.write_text(json.dumps({'mmdc': {
+                'path': real_path, 'mtime_ns': mtime_ns, 'version': version,
+            }}), encoding='utf-8')
+    return version
+
+
+@_locked_cache(maxsize=1)
+def _mmdc_args():
+    """按 mmdc 版本生成一次命令行参数（不含输入/输出文件）"""
+    args = ['-e', 'png', '-s', '2']
+    version = mmdc_version()
+    if version is not None and version >= (10, 0, 0):
+        # 10.x 起支持 -p，预先给出 Chromium 启动参数
+        config = CACHE_DIR / 'puppeteer.json'
+        with contextlib.suppress(OSError):
+            CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            config.write_text(json.dumps({'args': _chromium_args()}), encoding='utf-8')
+            args.extend(['-p', str(config)])
+    return args
+
+
+def _run_mmdc(input_file, output_file, timeout=None):
+    """整文件调用 mmdc（每次调用都会冷启动 Node + Chromium）"""
+    not_found = f"{_mmdc_command()} 命令未找到，请安装 mermaid-cli: npm install -g @mermaid-js/mermaid-cli"
+    mmdc_path = check_dependencies()['mmdc']
+    if mmdc_path is None:
+        # 启动时已确认找不到 mmdc，批量转换时不必每个文件再去 PATH 中试一次
+        raise RuntimeError(not_found)
+    cmd = [*_mmdc_invocation(), '-i', str(input_file), '-o', str(output_file), *_mmdc_args()]
+
+    try:
+        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+                       timeout=timeout)
     except subprocess.CalledProcessError as e:
         raise RuntimeError(f"mmdc 转换失败:\n{e.stderr}") from e
+    except subprocess.TimeoutExpired as e:
+        raise RuntimeError(f"mmdc 超过 {timeout} 秒未完成") from e
     except FileNotFoundError:
-        mmdc_name = "mmdc.cmd" if platform.system() == 'Windows' else "mmdc"
-        raise RuntimeError(f"{mmdc_name} 命令未找到，请安装 mermaid-cli: npm install -g @mermaid-js/mermaid-cli")
+        raise RuntimeError(not_found)
 
 
-def convert_to_docx(input_file, output_file, template_file=None):
-    """第二步：使用 pandoc 转换为 docx"""
-    cmd = ['pandoc', str(input_file), '-o', str(output_file), '--toc']
+def _mermaid_cache_key(source):
+    return hashlib.blake2b(source.encode('utf-8'), digest_size=16).hexdigest()
 
-    # 添加模板支持
+
+def _diagram_cache_key(source):
+    """渲染结果的缓存键：mmdc 版本 + 图表源码，升级 mmdc 后旧的 PNG 自动失效"""
+    version = '.'.join(map(str, mmdc_version() or ()))
+    return _mermaid_cache_key(f"{version}\0{source}")
+
+
+def _render_missing(missing):
+    """渲染缓存中没有的图表（key -> mermaid 源码），结果写入缓存目录"""
+    MERMAID_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    pool = _get_mermaid_pool()
+
+    if pool is not None:
+        # 各图表互不依赖，分给多个渲染进程并发处理
+        def _render_one(item):
+            key, source = item
+            tmp_png = MERMAID_CACHE_DIR / f"{key}.{uuid.uuid4().hex}.tmp"
+            try:
+                with pool.acquire() as worker:
+                    worker.render(source, tmp_png)
+                os.replace(tmp_png, MERMAID_CACHE_DIR / f"{key}.png")
+            finally:
+                tmp_png.unlink(missing_ok=True)
+
+        try:
+            _map(_render_one, list(missing.items()), MERMAID_WORKERS)
+            return
+        except RuntimeError as e:
+            logger.warning(f"⚠️ 常驻渲染进程出错，改为直接调用 mmdc: {e}")
+            missing = {key: source for key, source in missing.items()
+                       if not (MERMAID_CACHE_DIR / f"{key}.png").exists()}
+
+    # 没有常驻渲染进程时，把所有缺失的图表放进一个 Markdown，只调用一次 mmdc
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        batch_md = Path(tmp_dir) / 'batch.md'
+        batch_md.write_text(
+            ''.join(f"```mermaid\n{source}\n```\n\n" for source in missing.values()),
+            encoding='utf-8'
+        )
+        _run_mmdc(batch_md, Path(tmp_dir) / 'out.md')
+        # mmdc 按出现顺序输出 out-1.png、out-2.png ...
+        for index, key in enumerate(missing, start=1):
+            shutil.move(str(Path(tmp_dir) / f"out-{index}.png"), MERMAID_CACHE_DIR / f"{key}.png")
+
+
+def test_mmdc():
+    """诊断 mmdc：检查 PATH、版本，并实际渲染一个简单图表（需要启动 Node，只在 --test-mmdc 时执行）"""
+    mmdc_path = check_dependencies()['mmdc']
+    if mmdc_path is None:
+        logger.error(f"✗ PATH 中未找到 {_mmdc_command()}，请安装 mermaid-cli: npm install -g @mermaid-js/mermaid-cli")
+        return False
+    logger.info(f"✓ 找到 mmdc: {mmdc_path}")
+    cli_dir = _find_mermaid_cli_dir(mmdc_path)
+    if cli_dir is not None:
+        logger.info(f"✓ mermaid-cli 安装目录: {cli_dir}")
+    else:
+        logger.warning("⚠️ 未找到 mermaid-cli 安装目录，无法使用常驻渲染进程")
+
+    try:
+        result = subprocess.run([*_mmdc_invocation(), '--version'], capture_output=True, text=True, timeout=30,
+                                check=True)
+        logger.info(f"✓ mmdc 版本: {result.stdout.strip()}")
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.error(f"✗ 无法运行 mmdc --version: {e}")
+        return False
+
+    # 与实际转换走同一个 _run_mmdc（相同的参数和 Chromium 配置），诊断结果才有参考价值
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source = Path(tmp_dir) / 'test.mmd'
+        source.write_text("graph TD\n    A[开始] --> B[结束]\n", encoding='utf-8')
+        try:
+            _run_mmdc(source, Path(tmp_dir) / 'test.png', timeout=120)
+        except RuntimeError as e:
+            logger.error(f"✗ 功能测试失败: {e}")
+            return False
+    logger.info("✓ 功能测试通过")
+
+    if _get_mermaid_pool() is not None:
+        logger.info("✓ 常驻渲染进程可用")
+    else:
+        logger.warning("⚠️ 常驻渲染进程不可用，将逐批直接调用 mmdc（速度较慢）")
+    return True
+
+
+def _diagram_keys(text):
+    """文本中每个不同的 mermaid 图表源码 -> 缓存键"""
+    keys = {}
+    for match in _MERMAID_BLOCK_RE.finditer(text):
+        source = _block_source(match)
+        if source not in keys:
+            keys[source] = _diagram_cache_key(source)
+    return keys
+
+
+@functools.lru_cache(maxsize=256)
+def _read_diagrams(path, mtime_ns, size):
+    # 预渲染与 convert_mermaid 共用：同一版本的文件只读入、解码并提取图表一次
+    text = Path(path).read_text(encoding='utf-8')
+    return text, _diagram_keys(text)
+
+
+def _load_diagrams(input_file):
+    """(文件文本, {图表源码: 缓存键})；mtime/size 作为缓存键的一部分，与 _scan_mermaid 相同"""
+    st = os.stat(input_file)
+    return _read_diagrams(os.path.abspath(input_file), st.st_mtime_ns, st.st_size)
+
+
+def _missing_diagrams(keys):
+    return {key: source for source, key in keys.items()
+            if not (MERMAID_CACHE_DIR / f"{key}.png").exists()}
+
+
+def prerender_mermaid(input_files):
+    """批量转换前先收集所有文件中未缓存的图表，一次性渲染
+
+    没有常驻渲染进程时整批只启动一次 mmdc，而不是每个文件一次；
+    这里失败不中断，留给各文件转换时重试并单独报告
+    """
+    keys = {}
+    for input_file in input_files:
+        with contextlib.suppress(OSError, RuntimeError, UnicodeDecodeError):
+            if has_mermaid_diagrams(input_file):
+                keys.update(_load_diagrams(input_file)[1])
+
+    missing = _missing_diagrams(keys)
+    if not missing:
+        return
+    logger.debug(f"预先渲染 {len(missing)} 个 Mermaid 图表（共 {len(input_files)} 个文件）")
+    try:
+        _render_missing(missing)
+    except RuntimeError as e:
+        logger.warning(f"⚠️ 批量预渲染 Mermaid 图表失败，将逐个文件重试: {e}")
+
+
+def convert_mermaid(input_file, output_file):
+    """第一步：转换 mermaid 图表，输出引用 PNG 图片的 Markdown
+
+    渲染结果按图表源码和 mmdc 版本哈希缓存，未修改的图表不会重复渲染。
+    返回图表数量；没有完整的图表代码块时返回 0，且不写出 output_file
+    """
+    output_file = Path(output_file)
+    text, keys = _load_diagrams(input_file)
+    if not keys:
+        return 0
+    missing = _missing_diagrams(keys)
+    if missing:
+        try:
+            _render_missing(missing)
+        except RuntimeError as e:
+            raise RuntimeError(f"{e}\n提示: 运行 python scripts/convert.py --test-mmdc 诊断 mmdc 问题（参见 TROUBLESHOOTING.md）") from e
+    logger.debug(f"✓ Mermaid 图表已转换: {len(keys)} 个（缓存命中 {len(keys) - len(missing)} 个）")
+
+    def _image_ref(match):
+        png = MERMAID_CACHE_DIR / f"{keys[_block_source(match)]}.png"
+        return f"{match.group('indent')}![](<{png.resolve().as_posix()}>)"
+
+    output_file.write_text(_MERMAID_BLOCK_RE.sub(_image_ref, text), encoding='utf-8')
+    return len(keys)
+
+
+def _warm_template(template_path):
+    """把模板复制到 $XDG_RUNTIME_DIR（tmpfs）下，之后每次 pandoc 都从内存中读取"""
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if not runtime_dir:
+        return template_path
+    try:
+        st = os.stat(template_path)
+        # 文件名：<模板路径哈希>-<mtime/大小哈希>.docx，模板修改后旧副本按前缀清理
+        path_key = _mermaid_cache_key(os.path.abspath(template_path))
+        warm_dir = Path(runtime_dir) / 'md2docx'
+        warm_path = warm_dir / f"{path_key}-{_mermaid_cache_key(f'{st.st_mtime_ns}:{st.st_size}')}.docx"
+        if not warm_path.exists():
+            warm_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = warm_path.with_suffix(f".{uuid.uuid4().hex}.tmp")
+            shutil.copyfile(template_path, tmp_path)
+            os.replace(tmp_path, warm_path)
+            for stale in warm_dir.glob(f"{path_key}-*.docx"):
+                if stale != warm_path:
+                    stale.unlink(missing_ok=True)
+        return str(warm_path)
+    except OSError:
+        return template_path
+
+
+@_locked_cache()
+def _prepared_template(template_path, note, mtime_ns, size):
+    # 同一版本（mtime/大小）的模板只复制一次，提示信息也只输出一次
+    logger.debug(note)
+    return _warm_template(template_path)
+
+
+def _template_source(template_file):
+    """实际使用的模板文件（指定模板优先，其次 assets/template.docx），都没有时为 None"""
     if template_file and Path(template_file).exists():
-        cmd.extend(['--reference-doc', str(template_file)])
-        print(f"✓ 使用模板文件: {template_file}")
-    elif Path('assets/template.docx').exists():
-        cmd.extend(['--reference-doc', 'assets/template.docx'])
-        print("✓ 使用默认模板: assets/template.docx")
+        return os.fspath(template_file)
+    if Path('assets/template.docx').exists():
+        return 'assets/template.docx'
+    return None
+
 
+def _resolve_template(template_file):
+    """确定 --reference-doc（指定模板优先，其次 assets/template.docx）
+
+    每次都重新 stat 模板，模板修改后改用新的副本
+    """
+    template_path = _template_source(template_file)
+    if template_path is None:
+        return None
+    if template_file and template_path == os.fspath(template_file):
+        note = f"✓ 使用模板文件: {template_file}"
+    else:
+        note = f"✓ 使用默认模板: {template_path}"
     try:
-        subprocess.run(cmd, check=True, capture_output=True, text=True)
-        print(f"✓ Word 文档已生成: {output_file}")
+        st = os.stat(template_path)
+    except OSError:
+        return None
+    return _prepared_template(template_path, note, st.st_mtime_ns, st.st_size)
+
+
+def _count_headings(md_files):
+    """统计 ATX 与 Setext 标题数量（忽略代码块中的内容）"""
+    return sum(_count_heading_bytes(Path(f).read_bytes()) for f in md_files)
+
+
+def _count_heading_bytes(data):
+    return len(_HEADING_RE.findall(_FENCED_CODE_RE.sub(b'', data)))
+
+
+def _run_pandoc(cmd, input=None):
+    """运行 pandoc；stdout 直接丢弃，只收集 stderr 用于报错
+
+    非 --verbose 时加 --quiet，成功转换不再产生（也不必缓冲）警告输出；
+    --verbose 时把 pandoc 的警告逐条输出
+    """
+    verbose = logger.isEnabledFor(logging.DEBUG)
+    if not verbose:
+        cmd = [*cmd, '--quiet']
+    try:
+        result = subprocess.run(cmd, check=True, input=input, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        if verbose and result.stderr:
+            for line in result.stderr.decode('utf-8', errors='replace').splitlines():
+                logger.debug(f"  pandoc: {line}")
     except subprocess.CalledProcessError as e:
-        raise RuntimeError(f"pandoc 转换失败:\n{e.stderr}") from e
+        stderr = (e.stderr or b'').decode('utf-8', errors='replace')
+        raise RuntimeError(f"pandoc 转换失败:\n{stderr}") from e
     except FileNotFoundError:
         raise RuntimeError("pandoc 命令未找到，请安装 pandoc: https://pandoc.org/installing.html")
 
 
-def convert(input_file, output_file=None, template_file=None):
-    """主转换函数：协调两步转换流程"""
+def convert_to_docx(input_files, output_file, template_file=None, from_format=None, toc=None):
+    """第二步：使用 pandoc 转换为 docx
+
+    input_files 可以是单个文件，也可以是多个文件（合并为一个文档，只启动一次 pandoc）；
+    toc 为 None 时，标题少于 TOC_MIN_HEADINGS 个的文档不生成目录
+    """
+    if isinstance(input_files, (str, Path)):
+        input_files = [input_files]
+
+    # 单个文件只读一次：同一份字节既用于统计标题，又经 stdin 交给 pandoc
+    source = None
+    if len(input_files) == 1:
+        with _mapped(input_files[0]) as data:
+            source = data[:]
+        input_files = []
+        from_format = from_format or 'markdown'
+    if toc is None:
+        toc = (_count_heading_bytes(source) if source is not None
+               else _count_headings(input_files)) >= TOC_MIN_HEADINGS
+
+    cmd = [_executable('pandoc'), *(str(f) for f in input_files), '-o', str(output_file)]
+    if toc:
+        cmd.append('--toc')
+    if from_format:
+        cmd.extend(['-f', from_format])
+
+    # 添加模板支持
+    reference_doc = _resolve_template(template_file)
+    if reference_doc:
+        cmd.extend(['--reference-doc', reference_doc])
+
+    _run_pandoc(cmd, input=source)
+    logger.debug(f"✓ Word 文档已生成: {output_file}")
+
+
+def convert_to_docx_variants(input_files, targets):
+    """同一份 Markdown 套用多个模板：Markdown 只解析一次（pandoc JSON AST），再逐个模板生成 docx
+
+    targets 为 [(output_file, template_file), ...]
+    """
+    if isinstance(input_files, (str, Path)):
+        input_files = [input_files]
+
+    toc = _count_headings(input_files) >= TOC_MIN_HEADINGS
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        ast_file = Path(tmp_dir) / 'ast.json'
+        _run_pandoc([_executable('pandoc'), *(str(f) for f in input_files), '-t', 'json', '-o', str(ast_file)])
+        for output_file, template_file in targets:
+            convert_to_docx(ast_file, output_file, template_file, from_format='json', toc=toc)
+
+
+def _fetch_mermaid_ink(source):
+    """用 mermaid.ink 服务渲染图表（python 引擎使用，不需要 Node/Chromium），结果同样按哈希缓存"""
+    png = MERMAID_CACHE_DIR / f"ink-{_mermaid_cache_key(source)}.png"
+    if png.exists():
+        return png
+
+    url = MERMAID_INK_URL.format(base64.urlsafe_b64encode(source.encode('utf-8')).decode('ascii'))
+    try:
+        with urllib.request.urlopen(url, timeout=30) as response:
+            data = response.read()
+    except OSError as e:
+        raise RuntimeError(f"mermaid.ink 渲染失败: {e}") from e
+
+    MERMAID_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_png = png.with_suffix(f".{uuid.uuid4().hex}.tmp")
+    tmp_png.write_bytes(data)
+    os.replace(tmp_png, png)
+    return png
+
+
+def convert_to_docx_python(input_files, output_file, template_file=None):
+    """python 引擎：markdown → HTML → python-docx，不启动 pandoc 和 mmdc，适合结构简单的文档"""
+    try:
+        import markdown
+        from docx import Document
+        from htmldocx import HtmlToDocx
+    except ImportError as e:
+        raise RuntimeError("python 引擎需要额外的依赖: pip install markdown python-docx htmldocx") from e
+
+    if isinstance(input_files, (str, Path)):
+        input_files = [input_files]
+    text = '\n\n'.join(Path(f).read_text(encoding='utf-8') for f in input_files)
+
+    def _image_tag(match):
+        png = _fetch_mermaid_ink(_block_source(match))
+        return f'{match.group("indent")}<img src="{html.escape(str(png))}">'
+
+    body = markdown.markdown(_MERMAID_BLOCK_RE.sub(_image_tag, text),
+                             extensions=['extra', 'sane_lists'])
+
+    reference_doc = _resolve_template(template_file)
+    if reference_doc:
+        document = Document(reference_doc)
+        # 模板只提供样式，清空其中的示例内容（保留页面设置 sectPr）
+        for element in list(document.element.body):
+            if not element.tag.endswith('}sectPr'):
+                document.element.body.remove(element)
+    else:
+        document = Document()
+
+    HtmlToDocx().add_html_to_document(body, document)
+    document.save(str(output_file))
+    logger.debug(f"✓ Word 文档已生成: {output_file}")
+
+
+def _template_targets(output_path, template_file):
+    """[(输出文件, 模板)]；template_file 为多个模板时，每个模板输出一个 <名称>.<模板名>.docx"""
+    output_path = Path(output_path)
+    if isinstance(template_file, (list, tuple)) and len(template_file) > 1:
+        targets = [(output_path.with_name(f"{output_path.stem}.{Path(t).stem}.docx"), t)
+                   for t in template_file]
+        if len({out for out, _ in targets}) != len(targets):
+            raise ValueError(f"多个模板文件同名，输出文件会互相覆盖: {', '.join(map(str, template_file))}")
+        return targets
+    if isinstance(template_file, (list, tuple)):
+        template_file = template_file[0] if template_file else None
+    return [(output_path, template_file)]
+
+
+def _build_config(template_file, engine):
+    """{模板: 生成参数}：引擎以及实际使用的模板的路径、mtime 和大小
+
+    每次批量转换开始时计算一次，再传给各文件的 _up_to_date；不跨调用缓存，模板修改后立即生效
+    """
+    config = {}
+    for _, template in _template_targets('output.docx', template_file):
+        template_path = _template_source(template)
+        entry = {'engine': engine, 'template': None}
+        if template_path is not None:
+            with contextlib.suppress(OSError):
+                st = os.stat(template_path)
+                entry.update(template=os.path.abspath(template_path),
+                             template_mtime_ns=st.st_mtime_ns, template_size=st.st_size)
+        config[template] = entry
+    return config
+
+
+def _stamp_path(output_file):
+    # 记录输出文件由什么生成；放在缓存目录中，不在输出目录里留下额外文件
+    return CACHE_DIR / 'stamps' / f"{_mermaid_cache_key(os.path.abspath(output_file))}.json"
+
+
+def _write_stamps(targets, build_config):
+    """转换成功后为每个输出文件记录生成参数和输出文件自身的 mtime/大小"""
+    with contextlib.suppress(OSError):
+        (CACHE_DIR / 'stamps').mkdir(parents=True, exist_ok=True)
+        for out, template in targets:
+            st = os.stat(out)
+            _stamp_path(out).write_text(json.dumps({
+                **build_config[template], 'output': [st.st_mtime_ns, st.st_size],
+            }), encoding='utf-8')
+
+
+def _up_to_date(input_paths, output_path, template_file=None, engine='pandoc', build_config=None):
+    """输出文件是否无需重新转换
+
+    同 make 的判断，输出文件不能比输入文件旧；此外记录的生成参数（引擎、模板路径及其 mtime/大小）
+    必须与本次相同，且输出文件在那之后没有被改动。build_config 为 _build_config 的结果，
+    批量转换时由调用方算好传入
+    """
+    if build_config is None:
+        build_config = _build_config(template_file, engine)
+    try:
+        newest_input = max(os.stat(p).st_mtime_ns for p in input_paths)
+        for out, template in _template_targets(output_path, template_file):
+            st = os.stat(out)
+            if st.st_mtime_ns < newest_input:
+                return False
+            stamp = json.loads(_stamp_path(out).read_text(encoding='utf-8'))
+            if stamp != {**build_config[template], 'output': [st.st_mtime_ns, st.st_size]}:
+                return False
+    except (OSError, ValueError):
+        return False
+    return True
+
+
+def write_docx(md_files, output_path, template_file=None, engine='pandoc'):
+    """生成 docx，返回输出文件列表
+
+    template_file 为多个模板时，每个模板输出一个 <名称>.<模板名>.docx；
+    成功后记录生成参数，供 skip_unchanged 判断输出是否最新
+    """
+    targets = _template_targets(output_path, template_file)
+    if len(targets) > 1:
+        if engine == 'python':
+            for out, template in targets:
+                convert_to_docx_python(md_files, out, template)
+        else:
+            convert_to_docx_variants(md_files, targets)
+    elif engine == 'python':
+        convert_to_docx_python(md_files, output_path, targets[0][1])
+    else:
+        convert_to_docx(md_files, output_path, targets[0][1])
+    _write_stamps(targets, _build_config(template_file, engine))
+    return [str(out) for out, _ in targets]
+
+
+def _check_input(input_file):
+    """校验输入文件，返回 Path"""
     input_path = Path(input_file)
 
     if not input_path.exists():
@@ -67,34 +1001,243 @@ def convert(input_file, output_file=None, template_file=None):
     if not input_path.suffix.lower() == '.md':
         raise ValueError("只支持 .md 文件")
 
+    return input_path
+
+
+def _work_dir(keep_intermediate=False):
+    """整批转换共用的临时目录（优先放在内存盘 /dev/shm）；保留中间文件时不创建"""
+    if keep_intermediate:
+        return contextlib.nullcontext(None)
+    shm = '/dev/shm' if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK) else None
+    return tempfile.TemporaryDirectory(prefix='md2docx-', dir=shm)
+
+
+def prepare_markdown(input_path, work_dir=None, engine='pandoc'):
+    """第一步（按需）：转换 mermaid 图表，返回交给 pandoc 的 Markdown 文件
+
+    work_dir 为空时中间文件保留在输入文件旁边；python 引擎自行处理图表，这里直接返回原文件
+    """
+    if engine == 'python':
+        return input_path
+
+    if not has_mermaid_diagrams(input_path):
+        logger.debug(f"未检测到 Mermaid 图表: {input_path}")
+        return input_path
+
+    logger.debug(f"检测到 Mermaid 图表，先转换图表: {input_path}")
+    if work_dir is None:
+        intermediate_md = input_path.parent / f"{input_path.stem}.mmdc.md"
+    else:
+        fd, intermediate_md = tempfile.mkstemp(prefix=f"{input_path.stem}.", suffix='.md', dir=work_dir)
+        os.close(fd)
+        intermediate_md = Path(intermediate_md)
+    if not convert_mermaid(input_path, intermediate_md):
+        # 只是文中出现了 ```mermaid 字样（如行内代码），没有需要渲染的图表
+        if work_dir is not None:
+            intermediate_md.unlink(missing_ok=True)
+        logger.debug(f"未找到完整的 Mermaid 代码块: {input_path}")
+        return input_path
+    if work_dir is None:
+        logger.info(f"📄 中间文件已保留: {intermediate_md}")
+    return intermediate_md
+
+
+def _prepare_job(input_file, output_file=None, work_dir=None, engine='pandoc', template_file=None,
+                 skip_unchanged=False, build_config=None):
+    """转换的第一阶段：校验输入、确定输出文件名并处理 mermaid 图表
+
+    skip_unchanged 时输出文件已是最新则不做任何处理，返回的 Markdown 为 None
+    """
+    input_path = _check_input(input_file)
+
     # 生成输出文件名
     if output_file is None:
         output_file = input_path.with_suffix('.docx')
 
     output_path = Path(output_file)
 
-    print(f"开始转换: {input_path} → {output_path}")
+    if skip_unchanged and _up_to_date([input_path], output_path, template_file, engine, build_config):
+        logger.debug(f"已是最新，跳过: {input_path}")
+        return output_path, None
 
-    # 检查是否包含 mermaid 图表
-    has_mermaid = has_mermaid_diagrams(input_path)
+    logger.debug(f"开始转换: {input_path} → {output_path}")
 
-    if has_mermaid:
-        print("检测到 Mermaid 图表，执行两步转换...")
-        # 第一步：转换 mermaid 图表
-        intermediate_md = input_path.parent / f"{input_path.stem}.mmdc.md"
-        convert_mermaid(input_path, intermediate_md)
+    return output_path, prepare_markdown(input_path, work_dir, engine)
 
-        # 第二步：转换为 docx
-        convert_to_docx(intermediate_md, output_path, template_file)
 
-        print(f"📄 中间文件已保留: {intermediate_md}")
+def _finish_job(job, template_file=None, engine='pandoc'):
+    """转换的第二阶段：调用 pandoc 生成 docx"""
+    output_path, md_for_conversion = job
+    if md_for_conversion is None:
+        outputs = [str(out) for out, _ in _template_targets(output_path, template_file)]
     else:
-        print("未检测到 Mermaid 图表，直接转换...")
-        # 直接转换
-        convert_to_docx(input_path, output_path, template_file)
+        outputs = write_docx(md_for_conversion, output_path, template_file, engine)
+        logger.debug(f"✓ 输出文件: {', '.join(outputs)}")
+    return outputs[0] if len(outputs) == 1 else outputs
+
+
+def convert(input_file, output_file=None, template_file=None, work_dir=None, engine='pandoc',
+            skip_unchanged=False):
+    """主转换函数：协调两步转换流程
+
+    engine 为 'pandoc'（默认，mmdc + pandoc）或 'python'（markdown + python-docx + mermaid.ink）；
+    skip_unchanged 时，输出文件比输入文件新、且由相同的模板和引擎生成则直接返回（类似 make）
+    """
+    job = _prepare_job(input_file, output_file, work_dir, engine, template_file, skip_unchanged)
+    result = _finish_job(job, template_file, engine)
+    outputs = result if isinstance(result, str) else ', '.join(result)
+    if job[1] is None:
+        logger.info(f"✓ 输出文件已是最新，跳过: {outputs}（--force 强制重新转换）")
+    else:
+        logger.info(f"🎉 转换完成! 输出文件: {outputs}")
+    return result
+
+
+def _map(func, items, jobs):
+    """jobs > 1 时用线程池并发执行（耗时都在 pandoc/mmdc 子进程上，线程即可）"""
+    if jobs <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(func, items))
 
-    print(f"🎉 转换完成! 输出文件: {output_path}")
-    return str(output_path)
+
+def _pipeline(items, first_stage, second_stage):
+    """两级流水线：后台线程执行第一阶段（mermaid），当前线程执行第二阶段（pandoc）
+
+    第 K 个文件运行 pandoc 时，第 K+1 个文件的图表已经在渲染
+    """
+    if len(items) <= 1:
+        return [second_stage(first_stage(item)) for item in items]
+
+    handoff = queue.Queue(maxsize=2)
+    stop = threading.Event()
+
+    def _producer():
+        for item in items:
+            if stop.is_set():
+                return
+            try:
+                handoff.put((first_stage(item), None))
+            except Exception as e:
+                handoff.put((None, e))
+                return
+
+    producer = threading.Thread(target=_producer, daemon=True)
+    producer.start()
+
+    results = []
+    try:
+        for _ in items:
+            job, error = handoff.get()
+            if error is not None:
+                raise error
+            results.append(second_stage(job))
+    finally:
+        # 出错时让生产者尽快退出，并取走队列中的结果以免其阻塞
+        stop.set()
+        while producer.is_alive():
+            try:
+                handoff.get(timeout=0.1)
+            except queue.Empty:
+                pass
+    return results
+
+
+def convert_many(input_files, output_dir=None, template_file=None, jobs=1, keep_intermediate=False,
+                 engine='pandoc', skip_unchanged=False):
+    """批量转换：每个输入文件生成各自的 docx
+
+    output_dir 为空时输出到输入文件所在目录；jobs 为并发转换的文件数，
+    jobs 为 1 时以流水线方式重叠执行 mermaid 与 pandoc 两个阶段；
+    skip_unchanged 时跳过输出已是最新的文件；
+    某个文件失败时继续转换其余文件，最后汇总报告并抛出 RuntimeError
+    """
+    if output_dir is not None:
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+
+    # 一次性算好所有输出路径
+    tasks = [(f, None if output_dir is None else os.path.join(output_dir, Path(f).stem + '.docx'))
+             for f in input_files]
+
+    # 不同目录下的同名文件会写到同一个输出文件，提前报错而不是互相覆盖
+    seen = {}
+    for input_file, output_file in tasks:
+        target = os.path.abspath(output_file or Path(input_file).with_suffix('.docx'))
+        if target in seen:
+            raise ValueError(f"输出文件冲突: {seen[target]} 和 {input_file} 都会生成 {target}")
+        seen[target] = input_file
+
+    # 模板只 stat 一次，整批共用
+    build_config = _build_config(template_file, engine) if skip_unchanged else None
+
+    # 单个文件失败不影响其余文件，全部完成后统一报告
+    failures = {}
+    skipped = []
+
+    def _prepare(task):
+        try:
+            job = _prepare_job(*task, work_dir, engine, template_file, skip_unchanged, build_config)
+            if job[1] is None:
+                skipped.append(task[0])
+            return task, job
+        except Exception as e:
+            failures[task[0]] = e
+            return task, None
+
+    def _finish(prepared):
+        task, job = prepared
+        if job is None:
+            return None
+        try:
+            return _finish_job(job, template_file, engine)
+        except Exception as e:
+            failures[task[0]] = e
+            return None
+
+    if engine == 'pandoc' and len(tasks) > 1:
+        prerender_mermaid([f for f, out in tasks if not (
+            skip_unchanged
+            and _up_to_date([f], out or Path(f).with_suffix('.docx'), template_file, engine, build_config))])
+
+    with _work_dir(keep_intermediate) as work_dir:
+        if jobs <= 1:
+            results = _pipeline(tasks, _prepare, _finish)
+        else:
+            results = _map(lambda task: _finish(_prepare(task)), tasks, jobs)
+
+    if failures:
+        for input_file, _ in tasks:
+            if input_file in failures:
+                logger.error(f"❌ {input_file}: {failures[input_file]}")
+        raise RuntimeError(f"{len(failures)}/{len(tasks)} 个文件转换失败")
+    # 批量转换时不逐个文件输出，只汇总一次（-v 可查看每个文件）
+    note = f"（{len(skipped)} 个已是最新，跳过）" if skipped else ''
+    logger.info(f"🎉 转换完成! 共 {len(tasks)} 个文件{note}")
+    return results
+
+
+def convert_combined(input_files, output_file, template_file=None, jobs=1, keep_intermediate=False,
+                     engine='pandoc', skip_unchanged=False):
+    """合并转换（书籍模式）：所有输入文件按顺序合并为一个 docx，只调用一次 pandoc"""
+    input_paths = [_check_input(f) for f in input_files]
+    output_path = Path(output_file)
+
+    if skip_unchanged and _up_to_date(input_paths, output_path, template_file, engine):
+        outputs = [str(out) for out, _ in _template_targets(output_path, template_file)]
+        logger.info(f"✓ 输出文件已是最新，跳过: {', '.join(outputs)}（--force 强制重新转换）")
+        return outputs[0] if len(outputs) == 1 else outputs
+
+    logger.info(f"开始合并转换: {len(input_paths)} 个文件 → {output_path}")
+
+    if engine == 'pandoc' and len(input_paths) > 1:
+        prerender_mermaid(input_paths)
+
+    with _work_dir(keep_intermediate) as work_dir:
+        md_files = _map(lambda p: prepare_markdown(p, work_dir, engine), input_paths, jobs)
+        outputs = write_docx(md_files, output_path, template_file, engine)
+
+    logger.info(f"🎉 转换完成! 输出文件: {', '.join(outputs)}")
+    return outputs[0] if len(outputs) == 1 else outputs
 
 
 def main():
@@ -106,19 +1249,71 @@ def main():
 示例:
   python convert.py README.md
   python convert.py README.md output.docx
+  python convert.py a.md b.md c.md --output-dir out/
+  python convert.py docs/ --jobs 4
+  python convert.py docs/ --jobs 0                  # 按 CPU 核数并发
+  python convert.py ch1.md ch2.md ch3.md book.docx
+  python convert.py README.md --template a.docx --template b.docx
+  python convert.py README.md --engine python
+  python convert.py docs/ --force                   # 输出已是最新也重新转换
+  python convert.py --test-mmdc
         """
     )
 
-    parser.add_argument('input_file', help='输入的 Markdown 文件 (.md)')
-    parser.add_argument('output_file', nargs='?', help='输出的 Word 文件 (.docx，可选)')
-    parser.add_argument('--template', help='Word 模板文件 (.docx，可选)')
+    parser.add_argument('input_files', nargs='*', metavar='input_file',
+                        help='输入的 Markdown 文件 (.md)；最后一个参数为 .docx 时作为输出文件')
+    parser.add_argument('--output-dir', help='批量转换时的输出目录 (可选)')
+    parser.add_argument('--template', action='append',
+                        help='Word 模板文件 (.docx，可选)；可重复指定，每个模板生成一个文档')
+    parser.add_argument('--keep-intermediate', action='store_true',
+                        help='在输入文件旁保留 Mermaid 转换后的中间 Markdown')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='并发转换的文件数，0 表示按 CPU 核数 (默认 1)')
+    parser.add_argument('--engine', choices=['pandoc', 'python'], default='pandoc',
+                        help='转换引擎：pandoc（默认）或 python（无需 pandoc/mmdc，适合简单文档）')
+    parser.add_argument('--force', action='store_true',
+                        help='重新转换所有文件（默认跳过输出比输入文件新、且模板和引擎都未改变的文件）')
+    parser.add_argument('-v', '--verbose', action='store_true', help='输出每一步的详细信息')
+    parser.add_argument('--test-mmdc', action='store_true', help='诊断 mmdc 是否可用并实际渲染一个测试图表')
 
-    args = parser.parse_args()
+    args = parser.parse_intermixed_args()
+    if args.jobs < 0:
+        parser.error("--jobs 不能为负数")
+    if args.jobs == 0:
+        # 与 make -j 类似：每个文件一个 pandoc 进程，按 CPU 核数同时运行
+        args.jobs = os.cpu_count() or 1
+    listener = configure_logging(args.verbose, parallel=args.jobs > 1)
+    if listener is not None:
+        atexit.register(listener.stop)
+
+    if args.test_mmdc:
+        sys.exit(0 if test_mmdc() else 1)
+
+    input_files = args.input_files
+    output_file = None
+    if len(input_files) > 1 and input_files[-1].lower().endswith('.docx'):
+        output_file = input_files.pop()
+    input_files = expand_inputs(input_files)
+    if not input_files:
+        parser.error("没有找到要转换的 .md 文件")
 
     try:
-        convert(args.input_file, args.output_file, args.template)
+        # 批量转换前只检查一次依赖
+        if args.engine == 'pandoc' and check_dependencies()['pandoc'] is None:
+            raise RuntimeError("pandoc 命令未找到，请安装 pandoc: https://pandoc.org/installing.html")
+
+        if output_file and len(input_files) > 1:
+            # 多个输入 + 一个输出：合并为一个文档
+            convert_combined(input_files, output_file, args.template, args.jobs, args.keep_intermediate,
+                             args.engine, skip_unchanged=not args.force)
+        elif output_file:
+            with _work_dir(args.keep_intermediate) as work_dir:
+                convert(input_files[0], output_file, args.template, work_dir, args.engine,
+                        skip_unchanged=not args.force)
+        else:
+            convert_many(input_files, args.output_dir, args.template, args.jobs, args.keep_intermediate,
+                         args.engine, skip_unchanged=not args.force)
     except Exception as e:
-        print(f"❌ 错误: {e}", file=sys.stderr)
+        logger.error(f"❌ 错误: {e}")
         sys.exit(1)
 
 
@@ -6,88 +6,227 @@ Checks and guides installation of required dependencies.
 
 import subprocess
 import sys
+import functools
+import os
 import platform
+import shlex
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from types import MappingProxyType
+
+
+# Seconds to wait for a tool's version command before giving up on it
+CHECK_TIMEOUT = 5
+
+# Separator lines used in the reports
+_RULE = "-" * 40
+_DOUBLE_RULE = "=" * 50
+_TOOL_RULE = "-" * 20
+
+# platform.system() calls uname(); look it up once per process
+_SYSTEM = platform.system().lower()
+
+# Popen only uses posix_spawn (no fork of this process) for an absolute
+# executable with close_fds off; our own descriptors are non-inheritable
+# anyway (PEP 446). Windows keeps the default.
+_CLOSE_FDS = os.name != "posix"
+
+
+def _resolve_argv(argv):
+    """Return argv with argv[0] resolved to its full path on PATH, or None if not found"""
+    executable = shutil.which(argv[0])
+    if executable is None:
+        return None
+    return [executable, *argv[1:]]
+
+
+@functools.lru_cache(maxsize=1)
+def _read_os_release():
+    """Parse os-release once per process; values may be quoted, so use shlex"""
+    os_release = {}
+    for path in ("/etc/os-release", "/usr/lib/os-release"):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    for token in shlex.split(line, comments=True):
+                        key, sep, value = token.partition("=")
+                        if sep:
+                            os_release[key] = value
+            break
+        except (OSError, ValueError):
+            continue
+    return os_release
+
+
+# Installation data for each tool; static, so built once per process
+_REQUIRED_TOOLS = {
+    "pandoc": {
+        "check_argv": ["pandoc", "--version"],
+        "install_windows": "Download from https://pandoc.org/installing.html",
+        "install_macos": "brew install pandoc",
+        "install_linux": {
+            "ubuntu": "sudo apt update && sudo apt install pandoc",
+            "debian": "sudo apt update && sudo apt install pandoc",
+            "fedora": "sudo dnf install pandoc",
+            "centos": "sudo yum install pandoc",
+            "arch": "sudo pacman -S pandoc"
+        }
+    },
+    "mmdc": {
+        "check_argv": ["mmdc", "--version"],
+        "install_windows": "npm install -g @mermaid-js/mermaid-cli",
+        "install_macos": "npm install -g @mermaid-js/mermaid-cli",
+        "install_linux": {
+            "_default": "npm install -g @mermaid-js/mermaid-cli"
+        }
+    }
+}
+
+# Fixed order in which tools are checked and reported
+_TOOL_ORDER = tuple(_REQUIRED_TOOLS)
 
 
 class DependencyInstaller:
+    # Read-only view shared by all instances
+    required_tools = MappingProxyType(_REQUIRED_TOOLS)
+
     def __init__(self):
-        self.system = platform.system().lower()
-        self.required_tools = {
-            "pandoc": {
-                "check_cmd": "pandoc --version",
-                "install_windows": "Download from https://pandoc.org/installing.html",
-                "install_macos": "brew install pandoc",
-                "install_linux": {
-                    "ubuntu": "sudo apt update && sudo apt install pandoc",
-                    "debian": "sudo apt update && sudo apt install pandoc",
-                    "fedora": "sudo dnf install pandoc",
-                    "centos": "sudo yum install pandoc",
-                    "arch": "sudo pacman -S pandoc"
-                }
-            },
-            "mmdc": {
-                "check_cmd": "mmdc --version",
-                "install_windows": "npm install -g @mermaid-js/mermaid-cli",
-                "install_macos": "npm install -g @mermaid-js/mermaid-cli",
-                "install_linux": "npm install -g @mermaid-js/mermaid-cli"
-            }
-        }
+        self.system = _SYSTEM
+        self._check_cache = {}
+        self._npm_path = None
+
+    def check_tool(self, tool_name, verify_runs=False):
+        """Check if a tool is installed (result is cached per tool)
+
+        By default this only looks the tool up on PATH; verify_runs=True also
+        runs its version command to confirm it actually works.
+        """
+        if verify_runs:
+            return self._run_check_cmd(tool_name)
+        if tool_name not in self._check_cache:
+            self._check_cache[tool_name] = (
+                tool_name in self.required_tools and shutil.which(tool_name) is not None
+            )
+        return self._check_cache[tool_name]
 
-    def check_tool(self, tool_name):
-        """Check if a tool is installed"""
+    def _run_check_cmd(self, tool_name):
         tool_info = self.required_tools.get(tool_name)
         if not tool_info:
             return False
+        argv = _resolve_argv(tool_info["check_argv"])
+        if argv is None:
+            return False
 
         try:
-            result = subprocess.run(
-                tool_info["check_cmd"].split(),
-                capture_output=True,
-                text=True,
-                timeout=5
+            # Only the return code matters; don't create pipes or decode output
+            process = subprocess.Popen(
+                argv,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                close_fds=_CLOSE_FDS
             )
-            return result.returncode == 0
-        except (FileNotFoundError, subprocess.SubprocessError, subprocess.TimeoutExpired):
+        except OSError:
+            return False
+
+        try:
+            return process.wait(timeout=CHECK_TIMEOUT) == 0
+        except subprocess.TimeoutExpired:
+            # A hung binary counts as not working; don't leave it running
+            process.kill()
+            process.wait()
             return False
 
-    def check_all_dependencies(self):
-        """Check all required dependencies"""
-        print("Checking dependencies...")
-        print("-" * 40)
+    def invalidate_cache(self, tool_name=None):
+        """Forget cached check results (for one tool, or all of them)"""
+        if tool_name is None:
+            self._check_cache.clear()
+            self._npm_path = None
+        else:
+            self._check_cache.pop(tool_name, None)
+
+    def _find_npm(self):
+        """Full path of npm (looked up once), or None if it is not on PATH"""
+        if self._npm_path is None:
+            self._npm_path = shutil.which("npm") or ""
+        return self._npm_path or None
+
+    def check_all_dependencies(self, verify_runs=False):
+        """Check all required dependencies
+
+        With verify_runs=True every tool's version command is run; the
+        commands are independent, so they run concurrently.
+        """
+        # Header goes out before the (possibly slow) checks; the report is one write
+        sys.stdout.write(f"Checking dependencies...\n{_RULE}\n")
+        sys.stdout.flush()
 
         missing_tools = []
         installed_tools = []
 
-        for tool in self.required_tools:
-            if self.check_tool(tool):
-                print(f"✓ {tool}: Installed")
+        tools = _TOOL_ORDER
+        if verify_runs:
+            with ThreadPoolExecutor(max_workers=min(8, len(tools))) as pool:
+                results = dict(zip(tools, pool.map(lambda t: self.check_tool(t, verify_runs=True), tools)))
+        else:
+            results = {tool: self.check_tool(tool) for tool in tools}
+
+        out = []
+        for tool in tools:
+            if results[tool]:
+                out.append(f"✓ {tool}: Installed")
                 installed_tools.append(tool)
             else:
-                print(f"✗ {tool}: Not found")
+                out.append(f"✗ {tool}: Not found")
                 missing_tools.append(tool)
 
-        print("-" * 40)
+        out.append(_RULE)
 
         if not missing_tools:
-            print("✓ All dependencies are installed!")
-            return True
-
-        print(f"Missing dependencies: {', '.join(missing_tools)}")
-        return False
+            out.append("✓ All dependencies are installed!")
+        else:
+            out.append(f"Missing dependencies: {', '.join(missing_tools)}")
+        sys.stdout.write("\n".join(out) + "\n")
+        return not missing_tools
 
     def get_linux_distro(self):
-        """Try to detect Linux distribution"""
-        try:
-            with open("/etc/os-release", "r") as f:
-                for line in f:
-                    if line.startswith("ID="):
-                        return line.split("=")[1].strip().lower()
-        except (FileNotFoundError, PermissionError):
-            pass
+        """Try to detect Linux distribution
+
+        Derivatives (e.g. Mint, Manjaro) are mapped through ID_LIKE to a
+        distribution we have instructions for.
+        """
+        os_release = _read_os_release()
+        distro = os_release.get("ID", "unknown").lower()
+        known = set()
+        for tool_info in self.required_tools.values():
+            known.update(tool_info["install_linux"])
+        known.discard("_default")
+        if distro not in known:
+            for like in os_release.get("ID_LIKE", "").lower().split():
+                if like in known:
+                    return like
+        return distro
 
-        return "unknown"
+    def _render_win(self, tool_info):
+        return f"Windows: {tool_info['install_windows']}"
+
+    def _render_mac(self, tool_info):
+        return f"macOS: {tool_info['install_macos']}"
+
+    def _render_linux(self, distro, tool_info):
+        install_linux = tool_info["install_linux"]
+        if distro in install_linux:
+            return f"Linux ({distro}): {install_linux[distro]}"
+        return f"Linux (general): {install_linux.get('_default') or install_linux['ubuntu']}"
+
+    def _instruction_renderer(self):
+        """Pick the instruction line renderer for this platform (None if unsupported)
+
+        The distribution is only looked up on Linux, once per report.
+        """
+        if self.system == "linux":
+            return functools.partial(self._render_linux, self.get_linux_distro())
+        return {"windows": self._render_win, "darwin": self._render_mac}.get(self.system)
 
     def show_installation_instructions(self, tool=None):
         """Show installation instructions for missing tools"""
@@ -95,7 +234,7 @@ class DependencyInstaller:
             tools_to_show = [tool]
         else:
             tools_to_show = [
-                t for t in self.required_tools
+                t for t in _TOOL_ORDER
                 if not self.check_tool(t)
             ]
 
@@ -103,27 +242,19 @@ class DependencyInstaller:
             print("All dependencies are already installed.")
             return
 
-        print("\nInstallation Instructions:")
-        print("=" * 50)
+        render = self._instruction_renderer()
+        out = ["\nInstallation Instructions:", _DOUBLE_RULE]
 
         for tool in tools_to_show:
             tool_info = self.required_tools[tool]
-            print(f"\n{tool.upper()}:")
-            print("-" * 20)
-
-            if self.system == "windows":
-                print(f"Windows: {tool_info['install_windows']}")
-            elif self.system == "darwin":  # macOS
-                print(f"macOS: {tool_info['install_macos']}")
-            elif self.system == "linux":
-                distro = self.get_linux_distro()
-                if distro in tool_info["install_linux"]:
-                    print(f"Linux ({distro}): {tool_info['install_linux'][distro]}")
-                else:
-                    print(f"Linux (general): {tool_info['install_linux'].get('ubuntu', tool_info['install_linux'].get('ubuntu', 'npm install -g @mermaid-js/mermaid-cli'))}")
+            out.append(f"\n{tool.upper()}:")
+            out.append(_TOOL_RULE)
+            if render:
+                out.append(render(tool_info))
 
-        print("\n" + "=" * 50)
-        print("After installing dependencies, run this check again to verify.")
+        out.append("\n" + _DOUBLE_RULE)
+        out.append("After installing dependencies, run this check again to verify.")
+        sys.stdout.write("\n".join(out) + "\n")
 
     def attempt_auto_install(self, tool):
         """Attempt to automatically install a tool (limited functionality)"""
@@ -133,16 +264,21 @@ class DependencyInstaller:
             return False
 
         elif tool == "mmdc":
-            if not shutil.which("npm"):
+            npm = self._find_npm()
+            if npm is None:
                 print("npm is required to install mmdc. Please install Node.js first.")
                 return False
 
             try:
                 print(f"Attempting to install {tool}...")
-                cmd = ["npm", "install", "-g", "@mermaid-js/mermaid-cli"]
-                result = subprocess.run(cmd, capture_output=True, text=True)
+                cmd = [npm, "install", "-g", "@mermaid-js/mermaid-cli"]
+                result = subprocess.run(cmd, capture_output=True, text=True, close_fds=_CLOSE_FDS)
 
                 if result.returncode == 0:
+                    self.invalidate_cache(tool)
+                    if not self.check_tool(tool, verify_runs=True):
+                        print(f"{tool} was installed but cannot be run; check that npm's global bin directory is on PATH.")
+                        return False
                     print(f"✓ {tool} installed successfully!")
                     return True
                 else:
@@ -159,7 +295,10 @@ class DependencyInstaller:
 def main():
     installer = DependencyInstaller()
 
-    if len(sys.argv) > 1:
+    if len(sys.argv) > 1 and sys.argv[1] == "--verify":
+        # Also run each tool's version command to confirm it works
+        sys.exit(0 if installer.check_all_dependencies(verify_runs=True) else 1)
+    elif len(sys.argv) > 1:
         if sys.argv[1] == "--install":
             if len(sys.argv) > 2:
                 tool = sys.argv[2]
@@ -176,7 +315,7 @@ def main():
                 installer.show_installation_instructions()
         else:
             print("Usage:")
-            print("  python install_dependencies.py [--install <tool>] [--instructions [<tool>]]")
+            print("  python install_dependencies.py [--verify] [--install <tool>] [--instructions [<tool>]]")
     else:
         # Default behavior: check all dependencies
         all_installed = installer.check_all_dependencies()
@@ -0,0 +1,51 @@
+#!/usr/bin/env node
+// 常驻 Mermaid 渲染进程：只启动一次浏览器，逐行读取 stdin 中的 JSON 请求
+//
+// 用法: node mmdc_server.mjs <@mermaid-js/mermaid-cli 安装目录> [Chromium 启动参数 JSON 数组]
+// 请求: {"source": "<mermaid 源码>", "output": "<png 路径>"}
+// 响应: {"ok": true} 或 {"ok": false, "error": "..."}
+// 启动完成后先输出一行 {"ready": true}
+
+import { createRequire } from 'node:module';
+import { pathToFileURL } from 'node:url';
+import path from 'node:path';
+import fs from 'node:fs/promises';
+import readline from 'node:readline';
+
+const reply = (obj) => process.stdout.write(JSON.stringify(obj) + '\n');
+
+const cliDir = process.argv[2];
+const chromiumArgs = process.argv[3] ? JSON.parse(process.argv[3]) : [];
+let browser;
+let renderMermaid;
+
+try {
+  // puppeteer 是 mermaid-cli 的依赖，从其安装目录解析
+  const require = createRequire(path.join(cliDir, 'package.json'));
+  const puppeteer = require('puppeteer');
+  ({ renderMermaid } = await import(pathToFileURL(path.join(cliDir, 'src', 'index.js')).href));
+  browser = await puppeteer.launch({ headless: true, args: chromiumArgs });
+} catch (err) {
+  reply({ ready: false, error: String((err && err.message) || err) });
+  process.exit(1);
+}
+
+reply({ ready: true });
+
+const rl = readline.createInterface({ input: process.stdin, crlfDelay: Infinity });
+for await (const line of rl) {
+  if (!line.trim()) continue;
+  try {
+    const { source, output } = JSON.parse(line);
+    const { data } = await renderMermaid(browser, source, 'png', {
+      viewport: { width: 800, height: 600, deviceScaleFactor: 2 },
+      backgroundColor: 'white',
+    });
+    await fs.writeFile(output, data);
+    reply({ ok: true });
+  } catch (err) {
+    reply({ ok: false, error: String((err && err.message) || err) });
+  }
+}
+
+await browser.close();
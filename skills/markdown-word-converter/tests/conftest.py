@@ -0,0 +1,24 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'scripts'))
+
+import convert  # noqa: E402
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'real_deps: 使用真实的 check_dependencies/mmdc_version（测试自行隔离）')
+
+
+@pytest.fixture(autouse=True)
+def _isolate_converter(request, tmp_path, monkeypatch):
+    """测试不读写用户真实的缓存目录，也不运行本机的 mmdc --version"""
+    cache_dir = tmp_path / 'md2docx-cache'
+    monkeypatch.setattr(convert, 'CACHE_DIR', cache_dir)
+    monkeypatch.setattr(convert, 'MERMAID_CACHE_DIR', cache_dir / 'mermaid')
+    monkeypatch.delenv('XDG_RUNTIME_DIR', raising=False)
+    if request.node.get_closest_marker('real_deps') is None:
+        monkeypatch.setattr(convert, 'check_dependencies', lambda: {'pandoc': None, 'mmdc': None, 'node': None})
+        monkeypatch.setattr(convert, 'mmdc_version', lambda: None)
@@ -0,0 +1,741 @@
+import ast
+import logging
+import os
+import struct
+import subprocess
+import threading
+import zlib
+from pathlib import Path
+
+import pytest
+
+import convert
+
+
+def test_expand_inputs_skips_intermediate_files(tmp_path):
+    (tmp_path / 'a.md').write_text('# a\n', encoding='utf-8')
+    (tmp_path / 'a.mmdc.md').write_text('# a\n', encoding='utf-8')
+
+    assert convert.expand_inputs([str(tmp_path)]) == [str(tmp_path / 'a.md')]
+    assert convert.expand_inputs([str(tmp_path / '*.md')]) == [str(tmp_path / 'a.md')]
+
+
+def test_convert_many_rejects_output_name_collisions(tmp_path):
+    for sub in ('x', 'y'):
+        (tmp_path / sub).mkdir()
+        (tmp_path / sub / 'a.md').write_text('# a\n', encoding='utf-8')
+
+    with pytest.raises(ValueError, match='输出文件冲突'):
+        convert.convert_many([str(tmp_path / 'x' / 'a.md'), str(tmp_path / 'y' / 'a.md')],
+                             output_dir=tmp_path / 'out')
+
+
+INDENTED_DOC = (
+    "- item\n\n"
+    "  ```mermaid\n"
+    "  graph TD\n"
+    "  A-->B\n"
+    "  ```\n\n"
+    "text between\n\n"
+    "```python\n"
+    "print('x')\n"
+    "```\n"
+)
+
+
+def test_mermaid_block_regex_handles_indented_fences():
+    matches = list(convert._MERMAID_BLOCK_RE.finditer(INDENTED_DOC))
+
+    assert len(matches) == 1
+    assert convert._block_source(matches[0]) == "graph TD\nA-->B"
+
+
+def test_convert_mermaid_keeps_text_after_indented_block(tmp_path, monkeypatch):
+    cache_dir = tmp_path / 'cache'
+    cache_dir.mkdir()
+    monkeypatch.setattr(convert, 'MERMAID_CACHE_DIR', cache_dir)
+    key = convert._diagram_cache_key("graph TD\nA-->B")
+    (cache_dir / f"{key}.png").write_bytes(b'png')
+
+    source = tmp_path / 'doc.md'
+    source.write_text(INDENTED_DOC, encoding='utf-8')
+    output = tmp_path / 'doc.mmdc.md'
+    convert.convert_mermaid(source, output)
+
+    result = output.read_text(encoding='utf-8')
+    assert f"  ![](<{(cache_dir / f'{key}.png').resolve().as_posix()}>)" in result
+    assert "text between" in result
+    assert "```python\nprint('x')\n```" in result
+    assert "```mermaid" not in result
+
+
+def test_diagram_cache_key_changes_with_mmdc_version(monkeypatch):
+    keys = set()
+    for version in ((10, 9, 1), (11, 4, 0), (11, 4, 0)):
+        monkeypatch.setattr(convert, 'mmdc_version', lambda: version)
+        keys.add(convert._diagram_cache_key("graph TD\nA-->B"))
+    assert len(keys) == 2
+
+
+def test_prepare_markdown_skips_files_without_complete_blocks(tmp_path, monkeypatch):
+    monkeypatch.setattr(convert, '_run_mmdc', lambda *args: pytest.fail('mmdc should not run'))
+    source = tmp_path / 'doc.md'
+    source.write_text("Use `` ```mermaid `` to start a diagram.\n", encoding='utf-8')
+    work_dir = tmp_path / 'work'
+    work_dir.mkdir()
+
+    assert not convert.has_mermaid_diagrams(source)
+    assert convert.prepare_markdown(source, work_dir) == source
+    assert convert.prepare_markdown(source) == source
+    assert convert.convert_mermaid(source, tmp_path / 'doc.mmdc.md') == 0
+    assert list(work_dir.iterdir()) == []
+    assert not (tmp_path / 'doc.mmdc.md').exists()
+
+
+def test_has_mermaid_diagrams_requires_a_complete_block(tmp_path):
+    cases = {
+        'inline.md': (b"Write ```mermaid fences like this.\n", False),
+        'unclosed.md': (b"```mermaid\ngraph TD\n", False),
+        'later.md': (b"see ```mermaid\n\n  ```mermaid\r\n  graph TD\r\n  ```\r\n", True),
+    }
+    for name, (data, expected) in cases.items():
+        (tmp_path / name).write_bytes(data)
+        assert convert.has_mermaid_diagrams(tmp_path / name) is expected, name
+
+
+def _fake_mmdc(calls):
+    """代替 mmdc：按出现顺序为每个图表写出 out-N.png，内容为图表源码"""
+    def _run(input_file, output_file):
+        text = Path(input_file).read_text(encoding='utf-8')
+        sources = [convert._block_source(m) for m in convert._MERMAID_BLOCK_RE.finditer(text)]
+        calls.append(sources)
+        for index, source in enumerate(sources, start=1):
+            Path(output_file).with_name(f"out-{index}.png").write_text(source, encoding='utf-8')
+    return _run
+
+
+def test_convert_mermaid_renders_only_cache_misses(tmp_path, monkeypatch):
+    cache_dir = tmp_path / 'cache'
+    cache_dir.mkdir()
+    calls = []
+    monkeypatch.setattr(convert, 'MERMAID_CACHE_DIR', cache_dir)
+    monkeypatch.setattr(convert, '_get_mermaid_pool', lambda: None)
+    monkeypatch.setattr(convert, '_run_mmdc', _fake_mmdc(calls))
+
+    cached_key = convert._diagram_cache_key("graph TD\nA-->B")
+    (cache_dir / f"{cached_key}.png").write_text('cached', encoding='utf-8')
+
+    source = tmp_path / 'doc.md'
+    source.write_text(
+        "```mermaid\ngraph TD\nA-->B\n```\n\n"
+        "```mermaid\ngraph LR\nC-->D\n```\n\n"
+        "```mermaid\ngraph LR\nE-->F\n```\n",
+        encoding='utf-8'
+    )
+    convert.convert_mermaid(source, tmp_path / 'doc.mmdc.md')
+
+    # 只有两个未缓存的图表交给 mmdc，且只调用一次
+    assert calls == [["graph LR\nC-->D", "graph LR\nE-->F"]]
+    # out-N.png 按顺序对应到各自的缓存键
+    for diagram in ("graph LR\nC-->D", "graph LR\nE-->F"):
+        png = cache_dir / f"{convert._diagram_cache_key(diagram)}.png"
+        assert png.read_text(encoding='utf-8') == diagram
+    assert (cache_dir / f"{cached_key}.png").read_text(encoding='utf-8') == 'cached'
+
+    # 再次转换全部命中缓存，不再调用 mmdc
+    convert.convert_mermaid(source, tmp_path / 'doc.mmdc.md')
+    assert len(calls) == 1
+
+
+def test_convert_mermaid_renders_equivalent_diagrams_once(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(convert, 'MERMAID_CACHE_DIR', tmp_path / 'cache')
+    monkeypatch.setattr(convert, '_get_mermaid_pool', lambda: None)
+    monkeypatch.setattr(convert, '_run_mmdc', _fake_mmdc(calls))
+
+    source = tmp_path / 'doc.md'
+    source.write_text(
+        "```mermaid\ngraph TD\nA-->B\n```\n\n"
+        "- legend\n\n  ```mermaid\n\n  graph TD  \n  A-->B\n  ```\n\n"
+        "```mermaid\r\ngraph TD\r\nA-->B\r\n```\r\n",
+        encoding='utf-8', newline=''
+    )
+    output = tmp_path / 'doc.mmdc.md'
+    assert convert.convert_mermaid(source, output) == 1
+
+    assert calls == [['graph TD\nA-->B']]
+    key = convert._diagram_cache_key("graph TD\nA-->B")
+    png = (tmp_path / 'cache' / f"{key}.png").resolve().as_posix()
+    assert output.read_text(encoding='utf-8').count(png) == 3
+
+
+def test_convert_many_renders_all_files_with_one_mmdc_run(tmp_path, monkeypatch):
+    cache_dir = tmp_path / 'cache'
+    calls = []
+    monkeypatch.setattr(convert, 'MERMAID_CACHE_DIR', cache_dir)
+    monkeypatch.setattr(convert, '_get_mermaid_pool', lambda: None)
+    monkeypatch.setattr(convert, '_run_mmdc', _fake_mmdc(calls))
+    monkeypatch.setattr(convert, 'write_docx', lambda md, out, template=None, engine='pandoc': [str(out)])
+
+    inputs = []
+    for name, diagram in (('a', 'graph TD\nA-->B'), ('b', 'graph LR\nC-->D'), ('c', 'graph TD\nA-->B')):
+        (tmp_path / f"{name}.md").write_text(f"# {name}\n\n```mermaid\n{diagram}\n```\n", encoding='utf-8')
+        inputs.append(str(tmp_path / f"{name}.md"))
+    (tmp_path / 'plain.md').write_text("# plain\n", encoding='utf-8')
+    inputs.append(str(tmp_path / 'plain.md'))
+
+    reads = []
+    real_read_text = Path.read_text
+
+    def _counting_read_text(self, *args, **kwargs):
+        reads.append(self.name)
+        return real_read_text(self, *args, **kwargs)
+
+    monkeypatch.setattr(Path, 'read_text', _counting_read_text)
+    convert.convert_many(inputs, output_dir=tmp_path / 'out')
+
+    # 三个文件中的两个不同图表合并为一次 mmdc 调用，各文件转换时全部命中缓存
+    assert calls == [['graph TD\nA-->B', 'graph LR\nC-->D']]
+    # 预渲染读过的文件，转换时不再读入
+    assert sorted(r for r in reads if r != 'batch.md') == ['a.md', 'b.md', 'c.md']
+
+
+class _FakeWorker:
+    def __init__(self, fail=False):
+        self.is_alive = True
+        self.fail = fail
+        self.rendered = []
+
+    def alive(self):
+        return self.is_alive
+
+    def render(self, source, output_png):
+        if self.fail:
+            self.is_alive = False
+            raise RuntimeError("mermaid 渲染进程通信失败")
+        self.rendered.append(source)
+        Path(output_png).write_text(source, encoding='utf-8')
+
+    def close(self):
+        self.is_alive = False
+
+
+def _fake_pool(monkeypatch, workers):
+    """用假进程构造 MermaidWorkerPool，workers 依次作为每次启动的结果（异常表示启动失败）"""
+    spawned = iter(workers)
+
+    def _spawn(mmdc_path):
+        worker = next(spawned)
+        if isinstance(worker, Exception):
+            raise worker
+        return worker
+
+    monkeypatch.setattr(convert, 'MermaidWorker', _spawn)
+    return convert.MermaidWorkerPool('mmdc', size=2)
+
+
+def test_worker_pool_replaces_dead_workers(monkeypatch):
+    first, second = _FakeWorker(), _FakeWorker()
+    pool = _fake_pool(monkeypatch, [first, second])
+
+    first.is_alive = False
+    with pool.acquire() as worker:
+        assert worker is second
+    with pool.acquire() as worker:
+        assert worker is second
+
+
+def test_worker_pool_waits_for_existing_worker_when_spawn_fails(monkeypatch):
+    first = _FakeWorker()
+    pool = _fake_pool(monkeypatch, [first, RuntimeError("spawn failed")])
+
+    with pool.acquire() as busy:
+        assert busy is first
+        result = []
+        thread = threading.Thread(target=lambda: result.append(pool._checkout()))
+        thread.start()
+    thread.join(timeout=5)
+    assert result == [first]
+
+
+def test_render_falls_back_to_mmdc_when_pool_fails(tmp_path, monkeypatch):
+    cache_dir = tmp_path / 'cache'
+    calls = []
+    pool = _fake_pool(monkeypatch, [_FakeWorker(fail=True), RuntimeError("spawn failed")])
+    monkeypatch.setattr(convert, 'MERMAID_CACHE_DIR', cache_dir)
+    monkeypatch.setattr(convert, '_get_mermaid_pool', lambda: pool)
+    monkeypatch.setattr(convert, '_run_mmdc', _fake_mmdc(calls))
+
+    convert._render_missing({'k1': "graph TD\nA-->B"})
+
+    assert calls == [["graph TD\nA-->B"]]
+    assert (cache_dir / 'k1.png').read_text(encoding='utf-8') == "graph TD\nA-->B"
+    assert not list(cache_dir.glob('*.tmp'))
+
+
+def test_write_docx_rejects_templates_with_same_name(tmp_path):
+    with pytest.raises(ValueError, match='同名'):
+        convert.write_docx(tmp_path / 'doc.md', tmp_path / 'doc.docx',
+                           [str(tmp_path / 'a' / 'style.docx'), str(tmp_path / 'b' / 'style.docx')])
+
+
+@pytest.mark.parametrize('jobs', [1, 3])
+def test_convert_many_converts_remaining_files_after_failure(tmp_path, monkeypatch, caplog, jobs):
+    converted = []
+
+    def _fake_write_docx(md_file, output_path, template_file=None, engine='pandoc'):
+        if Path(md_file).stem == 'bad':
+            raise RuntimeError("pandoc 转换失败")
+        converted.append(Path(md_file).name)
+        return [str(output_path)]
+
+    monkeypatch.setattr(convert, 'write_docx', _fake_write_docx)
+    inputs = []
+    for name in ('a', 'bad', 'c'):
+        (tmp_path / f"{name}.md").write_text(f"# {name}\n", encoding='utf-8')
+        inputs.append(str(tmp_path / f"{name}.md"))
+    inputs.append(str(tmp_path / 'missing.md'))
+
+    with pytest.raises(RuntimeError, match='2/4'):
+        convert.convert_many(inputs, jobs=jobs)
+
+    assert sorted(converted) == ['a.md', 'c.md']
+    errors = [r.getMessage() for r in caplog.records if r.levelno == logging.ERROR]
+    assert any('bad.md: pandoc 转换失败' in message for message in errors)
+    assert any('missing.md: 输入文件不存在' in message for message in errors)
+
+
+def test_convert_many_quiet_success_logs_once(tmp_path, monkeypatch, caplog):
+    monkeypatch.setattr(convert, 'write_docx', lambda md, out, template=None, engine='pandoc': [str(out)])
+    inputs = []
+    for name in ('a', 'b', 'c'):
+        (tmp_path / f"{name}.md").write_text(f"# {name}\n", encoding='utf-8')
+        inputs.append(str(tmp_path / f"{name}.md"))
+
+    with caplog.at_level(logging.INFO, logger=convert.logger.name):
+        convert.convert_many(inputs)
+
+    assert [r.getMessage() for r in caplog.records] == ['🎉 转换完成! 共 3 个文件']
+
+
+def test_locked_cache_computes_once_across_threads():
+    calls = []
+
+    @convert._locked_cache()
+    def slow(value):
+        calls.append(value)
+        threading.Event().wait(0.05)
+        return value * 2
+
+    threads = [threading.Thread(target=slow, args=(21,)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert calls == [21]
+    assert slow(21) == 42
+
+
+def test_resolve_template_reports_once(tmp_path, monkeypatch, caplog):
+    template = tmp_path / 'style.docx'
+    template.write_bytes(b'docx')
+    monkeypatch.setattr(convert, '_warm_template', lambda path: path)
+    convert._prepared_template.cache_clear()
+    try:
+        with caplog.at_level(logging.DEBUG, logger=convert.logger.name):
+            for _ in range(3):
+                assert convert._resolve_template(str(template)) == str(template)
+    finally:
+        convert._prepared_template.cache_clear()
+    assert len(caplog.records) == 1
+
+
+def test_resolve_template_follows_template_edits(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_RUNTIME_DIR', str(tmp_path / 'run'))
+    template = tmp_path / 'style.docx'
+    template.write_bytes(b'v1')
+    first = convert._resolve_template(str(template))
+
+    template.write_bytes(b'version 2')
+    second = convert._resolve_template(str(template))
+    assert first != second
+    assert Path(second).read_bytes() == b'version 2'
+
+
+def test_count_headings_includes_setext_and_skips_code(tmp_path):
+    doc = tmp_path / 'doc.md'
+    doc.write_text(
+        "Title\n=====\n\nSection\n-------\n\n# ATX\n\n"
+        "```bash\n# comment\n```\n\n"
+        "para\n\n---\n",
+        encoding='utf-8'
+    )
+    assert convert._count_headings([doc]) == 3
+
+
+def test_warm_template_removes_stale_copies(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_RUNTIME_DIR', str(tmp_path / 'run'))
+    template = tmp_path / 'style.docx'
+    template.write_bytes(b'v1')
+    first = convert._warm_template(str(template))
+
+    template.write_bytes(b'version 2')
+    second = convert._warm_template(str(template))
+
+    assert first != second
+    assert Path(second).read_bytes() == b'version 2'
+    assert [p.name for p in (tmp_path / 'run' / 'md2docx').iterdir()] == [Path(second).name]
+
+
+def _tiny_png():
+    """1x1 像素的 PNG"""
+    def _chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+    return (b'\x89PNG\r\n\x1a\n'
+            + _chunk(b'IHDR', struct.pack('>IIBBBBB', 1, 1, 8, 2, 0, 0, 0))
+            + _chunk(b'IDAT', zlib.compress(b'\x00\xff\xff\xff'))
+            + _chunk(b'IEND', b''))
+
+
+def test_python_engine_converts_without_pandoc(tmp_path, monkeypatch):
+    docx = pytest.importorskip('docx')
+    pytest.importorskip('markdown')
+    pytest.importorskip('htmldocx')
+
+    png = tmp_path / 'diagram.png'
+    png.write_bytes(_tiny_png())
+    fetched = []
+    monkeypatch.setattr(convert, '_fetch_mermaid_ink', lambda source: fetched.append(source) or png)
+    monkeypatch.setattr(convert, '_run_pandoc', lambda cmd: pytest.fail("python 引擎不应调用 pandoc"))
+
+    source = tmp_path / 'doc.md'
+    source.write_text("# Title\n\ntext\n\n```mermaid\ngraph TD\nA-->B\n```\n", encoding='utf-8')
+    output = convert.convert(source, tmp_path / 'doc.docx', engine='python')
+
+    document = docx.Document(output)
+    assert [p.text for p in document.paragraphs if p.text] == ['Title', 'text']
+    assert len(document.inline_shapes) == 1
+    assert fetched == ["graph TD\nA-->B"]
+
+
+def test_module_defines_each_top_level_name_once():
+    tree = ast.parse(Path(convert.__file__).read_text(encoding='utf-8'))
+    names = [node.name for node in tree.body
+             if isinstance(node, (ast.FunctionDef, ast.ClassDef))]
+
+    assert len(names) == len(set(names))
+    assert set(convert.__all__) <= set(names)
+
+
+@pytest.mark.real_deps
+def test_mmdc_version_is_persisted_and_selects_args(tmp_path, monkeypatch):
+    mmdc = tmp_path / 'mmdc'
+    mmdc.write_text('', encoding='utf-8')
+    runs = []
+
+    def _fake_run(cmd, **kwargs):
+        runs.append(cmd)
+        return subprocess.CompletedProcess(cmd, 0, stdout='11.4.0\n', stderr='')
+
+    monkeypatch.setattr(convert, 'CACHE_DIR', tmp_path / 'cache')
+    monkeypatch.setattr(convert, 'check_dependencies', lambda: {'pandoc': None, 'mmdc': str(mmdc)})
+    monkeypatch.setattr(convert.subprocess, 'run', _fake_run)
+    convert.mmdc_version.cache_clear()
+    convert._mmdc_args.cache_clear()
+
+    try:
+        assert convert.mmdc_version() == (11, 4, 0)
+        args = convert._mmdc_args()
+        assert args[:4] == ['-e', 'png', '-s', '2']
+        assert args[4:] == ['-p', str(tmp_path / 'cache' / 'puppeteer.json')]
+
+        # 新进程（清空内存缓存）从 deps.json 读取版本，不再运行 mmdc --version
+        convert.mmdc_version.cache_clear()
+        assert convert.mmdc_version() == (11, 4, 0)
+        assert len(runs) == 1
+    finally:
+        convert.mmdc_version.cache_clear()
+        convert._mmdc_args.cache_clear()
+
+
+@pytest.mark.parametrize('parallel', [False, True])
+def test_configure_logging_splits_streams_and_verbosity(capsys, parallel):
+    try:
+        for verbose in (False, True):
+            listener = convert.configure_logging(verbose=verbose, parallel=parallel)
+            convert.logger.debug('detail')
+            convert.logger.info('progress')
+            convert.logger.error('failure')
+            if listener is not None:
+                listener.stop()
+            out, err = capsys.readouterr()
+            assert out == ('detail\nprogress\n' if verbose else 'progress\n')
+            assert err == 'failure\n'
+    finally:
+        convert.logger.handlers.clear()
+        convert.logger.propagate = True
+        convert.logger.setLevel(logging.NOTSET)
+
+
+def test_run_mmdc_does_not_spawn_when_mmdc_is_missing(tmp_path, monkeypatch):
+    monkeypatch.setattr(convert, 'check_dependencies', lambda: {'pandoc': None, 'mmdc': None})
+    monkeypatch.setattr(convert.subprocess, 'run', lambda *args, **kwargs: pytest.fail('spawned mmdc'))
+    with pytest.raises(RuntimeError, match='npm install -g @mermaid-js/mermaid-cli'):
+        convert._run_mmdc(tmp_path / 'in.md', tmp_path / 'out.md')
+
+
+def test_run_pandoc_quiet_unless_verbose(monkeypatch, caplog):
+    commands = []
+
+    def _fake_run(cmd, **kwargs):
+        commands.append(cmd)
+        return subprocess.CompletedProcess(cmd, 0, stderr=b'[WARNING] Could not fetch resource x.png\n')
+
+    monkeypatch.setattr(convert.subprocess, 'run', _fake_run)
+    with caplog.at_level(logging.INFO, logger=convert.logger.name):
+        convert._run_pandoc(['pandoc', 'in.md'])
+    with caplog.at_level(logging.DEBUG, logger=convert.logger.name):
+        convert._run_pandoc(['pandoc', 'in.md'])
+
+    assert commands == [['pandoc', 'in.md', '--quiet'], ['pandoc', 'in.md']]
+    assert [r.getMessage() for r in caplog.records] == ['  pandoc: [WARNING] Could not fetch resource x.png']
+
+
+def test_test_mmdc_renders_with_conversion_arguments(tmp_path, monkeypatch, caplog):
+    commands = []
+
+    def _fake_run(cmd, **kwargs):
+        commands.append(cmd)
+        return subprocess.CompletedProcess(cmd, 0, stdout='11.4.0\n', stderr='')
+
+    monkeypatch.setattr(convert, 'check_dependencies', lambda: {'pandoc': None, 'mmdc': '/opt/bin/mmdc'})
+    monkeypatch.setattr(convert, '_mmdc_args', lambda: ['-e', 'png', '-s', '2', '-p', 'puppeteer.json'])
+    monkeypatch.setattr(convert, '_get_mermaid_pool', lambda: object())
+    monkeypatch.setattr(convert.subprocess, 'run', _fake_run)
+
+    with caplog.at_level(logging.INFO, logger=convert.logger.name):
+        assert convert.test_mmdc()
+    version_cmd, render_cmd = commands
+    assert version_cmd == ['/opt/bin/mmdc', '--version']
+    assert render_cmd[0] == '/opt/bin/mmdc'
+    assert render_cmd[-6:] == ['-e', 'png', '-s', '2', '-p', 'puppeteer.json']
+
+
+@pytest.mark.real_deps
+def test_check_dependencies_finds_mmdc_under_npm_prefix(tmp_path, monkeypatch):
+    bin_dir = tmp_path / 'prefix' / 'bin'
+    bin_dir.mkdir(parents=True)
+    mmdc = bin_dir / 'mmdc'
+    mmdc.write_text('#!/bin/sh\n', encoding='utf-8')
+    mmdc.chmod(0o755)
+    home = tmp_path / 'home'
+    home.mkdir()
+    (home / '.npmrc').write_text(f"color=false\nprefix = {tmp_path / 'prefix'}\n", encoding='utf-8')
+    monkeypatch.setattr(convert.platform, 'system', lambda: 'Linux')
+    monkeypatch.setenv('PATH', str(tmp_path / 'empty'))
+    monkeypatch.setenv('HOME', str(home))
+    monkeypatch.delenv('npm_config_prefix', raising=False)
+    monkeypatch.delenv('NPM_CONFIG_PREFIX', raising=False)
+
+    convert._npm_prefix.cache_clear()
+    convert.check_dependencies.cache_clear()
+    try:
+        assert convert._npm_prefix() == tmp_path / 'prefix'
+        assert convert.check_dependencies()['mmdc'] == str(mmdc)
+
+        # 环境变量优先于 ~/.npmrc
+        monkeypatch.setenv('npm_config_prefix', str(tmp_path / 'other'))
+        convert._npm_prefix.cache_clear()
+        assert convert._npm_prefix() == tmp_path / 'other'
+    finally:
+        convert._npm_prefix.cache_clear()
+        convert.check_dependencies.cache_clear()
+
+
+def test_has_mermaid_diagrams_scans_without_reading_the_file(tmp_path, monkeypatch):
+    doc = tmp_path / 'big.md'
+    doc.write_bytes('中文段落\n'.encode('utf-8') * 100000 + b'```mermaid\ngraph TD\n```\n')
+    monkeypatch.setattr(Path, 'read_bytes', lambda self: pytest.fail('file read into memory'))
+    monkeypatch.setattr(Path, 'read_text', lambda self, *a, **k: pytest.fail('file decoded'))
+    assert convert.has_mermaid_diagrams(doc)
+
+
+def test_find_mermaid_cli_dir_next_to_windows_shim(tmp_path, monkeypatch):
+    cli_dir = tmp_path / 'npm' / 'node_modules' / '@mermaid-js' / 'mermaid-cli'
+    cli_dir.mkdir(parents=True)
+    (cli_dir / 'package.json').write_text('{}', encoding='utf-8')
+    shim = tmp_path / 'npm' / 'mmdc.cmd'
+    shim.write_text('@echo off\n', encoding='utf-8')
+    monkeypatch.setattr(convert, '_npm_modules_dir', lambda: None)
+
+    assert convert._find_mermaid_cli_dir(shim) == cli_dir
+    assert convert._find_mermaid_cli_dir(tmp_path / 'elsewhere' / 'mmdc') is None
+
+    # mmdc 不在 npm 前缀下（例如被复制到别处）时，按 npm 全局前缀定位
+    monkeypatch.setattr(convert, '_npm_modules_dir', lambda: tmp_path / 'npm' / 'node_modules')
+    assert convert._find_mermaid_cli_dir(tmp_path / 'elsewhere' / 'mmdc') == cli_dir
+    assert convert._which_in(tmp_path / 'npm', ('mmdc.cmd',)) is None  # 没有执行权限
+
+
+def test_mmdc_invocation_bypasses_windows_shim(tmp_path, monkeypatch):
+    npm_dir = tmp_path / 'npm'
+    cli_js = npm_dir / 'node_modules' / '@mermaid-js' / 'mermaid-cli' / 'src' / 'cli.js'
+    cli_js.parent.mkdir(parents=True)
+    cli_js.write_text('', encoding='utf-8')
+    (cli_js.parent.parent / 'package.json').write_text('{}', encoding='utf-8')
+    shim = npm_dir / 'mmdc.cmd'
+    shim.write_text('@echo off\n', encoding='utf-8')
+    node = npm_dir / 'node.exe'
+    node.write_text('', encoding='utf-8')
+    node.chmod(0o755)
+    monkeypatch.setattr(convert, 'check_dependencies', lambda: {'pandoc': None, 'mmdc': str(shim)})
+    monkeypatch.setattr(convert, '_npm_modules_dir', lambda: None)
+
+    monkeypatch.setattr(convert.platform, 'system', lambda: 'Linux')
+    assert convert._mmdc_invocation() == [str(shim)]
+    monkeypatch.setattr(convert.platform, 'system', lambda: 'Windows')
+    assert convert._mmdc_invocation() == [str(node), str(cli_js)]
+
+
+def test_convert_to_docx_feeds_single_file_on_stdin(tmp_path, monkeypatch):
+    md = tmp_path / 'doc.md'
+    md.write_bytes(b'# A\n\n## B\n\nC\n-\n\n```mermaid\ngraph TD\n```\n')
+    empty = tmp_path / 'empty.md'
+    empty.write_bytes(b'')
+    calls = []
+    monkeypatch.setattr(convert, '_executable', lambda name: name)
+    monkeypatch.setattr(convert, '_resolve_template', lambda template: None)
+    monkeypatch.setattr(convert, '_run_pandoc', lambda cmd, input=None: calls.append((cmd, input)))
+
+    assert convert.has_mermaid_diagrams(md)
+    assert not convert.has_mermaid_diagrams(empty)
+    convert.convert_to_docx(md, tmp_path / 'doc.docx')
+    convert.convert_to_docx(empty, tmp_path / 'empty.docx')
+
+    (cmd, data), (empty_cmd, empty_data) = calls
+    assert data == md.read_bytes()
+    assert str(md) not in cmd
+    assert cmd[-3:] == ['--toc', '-f', 'markdown']
+    assert empty_data == b'' and '--toc' not in empty_cmd
+
+
+def test_main_jobs_zero_uses_cpu_count(tmp_path, monkeypatch):
+    doc = tmp_path / 'doc.md'
+    doc.write_text("# doc\n", encoding='utf-8')
+    seen = {}
+
+    def _fake_convert_many(input_files, output_dir, template, jobs, keep_intermediate, engine, skip_unchanged):
+        seen['jobs'] = jobs
+        seen['skip_unchanged'] = skip_unchanged
+
+    monkeypatch.setattr(convert, 'convert_many', _fake_convert_many)
+    monkeypatch.setattr(convert, 'configure_logging', lambda verbose, parallel: None)
+    monkeypatch.setattr(convert, 'check_dependencies', lambda: {'pandoc': 'pandoc', 'mmdc': None})
+    monkeypatch.setattr(convert.os, 'cpu_count', lambda: 6)
+    monkeypatch.setattr(convert.sys, 'argv', ['convert.py', str(doc), '--jobs', '0'])
+    convert.main()
+    assert seen == {'jobs': 6, 'skip_unchanged': True}
+
+    monkeypatch.setattr(convert.sys, 'argv', ['convert.py', str(doc), '--force'])
+    convert.main()
+    assert seen == {'jobs': 1, 'skip_unchanged': False}
+
+
+def _fake_docx_writer(converted):
+    """代替 pandoc/python 引擎：记录转换的文件并写出 docx（write_docx 照常记录生成参数）"""
+    def _write(md_file, output_file, template_file=None, *args, **kwargs):
+        converted.append(Path(md_file).name)
+        Path(output_file).write_bytes(b'docx')
+    return _write
+
+
+def test_convert_many_skips_up_to_date_outputs(tmp_path, monkeypatch, caplog):
+    converted = []
+    monkeypatch.setattr(convert, 'convert_to_docx', _fake_docx_writer(converted))
+    monkeypatch.chdir(tmp_path)
+    template = tmp_path / 'style.docx'
+    template.write_bytes(b'template')
+    inputs = []
+    for name in ('a', 'b'):
+        (tmp_path / f"{name}.md").write_text(f"# {name}\n", encoding='utf-8')
+        inputs.append(str(tmp_path / f"{name}.md"))
+    for path in (template, *map(Path, inputs)):
+        os.utime(path, ns=(1_000_000_000, 1_000_000_000))
+
+    convert.convert_many(inputs, template_file=[str(template)], skip_unchanged=True)
+    assert converted == ['a.md', 'b.md']
+
+    # 输出比输入和模板都新：全部跳过
+    with caplog.at_level(logging.INFO, logger=convert.logger.name):
+        convert.convert_many(inputs, template_file=[str(template)], skip_unchanged=True)
+    assert converted == ['a.md', 'b.md']
+    assert caplog.records[-1].getMessage() == '🎉 转换完成! 共 2 个文件（2 个已是最新，跳过）'
+
+    def _touch_after_outputs(path):
+        newest = max(os.stat(tmp_path / f"{name}.docx").st_mtime_ns for name in ('a', 'b'))
+        os.utime(path, ns=(newest + 1_000_000_000, newest + 1_000_000_000))
+
+    # 修改输入或模板后重新转换；不跳过时总是转换
+    _touch_after_outputs(inputs[1])
+    convert.convert_many(inputs, template_file=[str(template)], skip_unchanged=True)
+    assert converted == ['a.md', 'b.md', 'b.md']
+    _touch_after_outputs(template)
+    convert.convert_many(inputs, template_file=[str(template)], skip_unchanged=True)
+    assert converted == ['a.md', 'b.md', 'b.md', 'a.md', 'b.md']
+    convert.convert_many(inputs[:1], template_file=[str(template)])
+    assert converted[-1] == 'a.md' and len(converted) == 6
+
+
+def test_skip_requires_same_template_and_engine(tmp_path, monkeypatch):
+    converted = []
+    monkeypatch.setattr(convert, 'convert_to_docx', _fake_docx_writer(converted))
+    monkeypatch.setattr(convert, 'convert_to_docx_python', _fake_docx_writer(converted))
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'assets').mkdir()
+    (tmp_path / 'assets' / 'template.docx').write_bytes(b'default')
+    corp = tmp_path / 'corp.docx'
+    corp.write_bytes(b'corp')
+    doc = tmp_path / 'doc.md'
+    doc.write_text("# doc\n", encoding='utf-8')
+    # 模板和输入都比输出旧，仅凭 mtime 会判断为最新
+    for path in (corp, doc, tmp_path / 'assets' / 'template.docx'):
+        os.utime(path, ns=(1_000_000_000, 1_000_000_000))
+
+    def _run(template=None, engine='pandoc'):
+        convert.convert(doc, template_file=template, engine=engine, skip_unchanged=True)
+        return len(converted)
+
+    assert _run() == 1
+    assert _run() == 1
+    assert _run(str(corp)) == 2
+    assert _run(str(corp), engine='python') == 3
+    assert _run(str(corp), engine='python') == 3
+
+    # 输出文件在转换之后被改动（例如手工编辑）时也重新生成
+    (tmp_path / 'doc.docx').write_bytes(b'edited by hand')
+    assert _run(str(corp), engine='python') == 4
+
+
+def test_template_is_checked_once_per_batch(tmp_path, monkeypatch):
+    monkeypatch.setattr(convert, 'write_docx', lambda md, out, template=None, engine='pandoc': [str(out)])
+    template = tmp_path / 'style.docx'
+    template.write_bytes(b'template')
+    inputs = []
+    for name in ('a', 'b', 'c'):
+        (tmp_path / f"{name}.md").write_text(f"# {name}\n", encoding='utf-8')
+        (tmp_path / f"{name}.docx").write_bytes(b'docx')
+        inputs.append(str(tmp_path / f"{name}.md"))
+
+    stats = []
+    real_stat = os.stat
+
+    def _counting_stat(path, *args, **kwargs):
+        stats.append(str(path))
+        return real_stat(path, *args, **kwargs)
+
+    monkeypatch.setattr(convert.os, 'stat', _counting_stat)
+    convert.convert_many(inputs[:1], template_file=[str(template)], skip_unchanged=True)
+    single = stats.count(str(template))
+    stats.clear()
+    convert.convert_many(inputs, template_file=[str(template)], skip_unchanged=True)
+    assert stats.count(str(template)) == single
@@ -0,0 +1,261 @@
+import builtins
+import io
+import subprocess
+import threading
+
+import pytest
+
+import install_dependencies
+
+
+def _counting_run(calls, returncode=0):
+    def _run(cmd, **kwargs):
+        calls.append(cmd)
+        return subprocess.CompletedProcess(cmd, returncode, stdout='', stderr='')
+    return _run
+
+
+def test_check_results_are_reused_until_invalidated(tmp_path, monkeypatch, capsys):
+    # Only the stubbed lookups count, whatever is installed on this machine
+    monkeypatch.setenv('PATH', str(tmp_path))
+    lookups = []
+    monkeypatch.setattr(install_dependencies.shutil, 'which', lambda name: lookups.append(name))
+    installer = install_dependencies.DependencyInstaller()
+    installer.system = 'darwin'
+
+    assert not installer.check_all_dependencies()
+    installer.show_installation_instructions()
+    assert sorted(lookups) == sorted(installer.required_tools)
+
+    installer.invalidate_cache('mmdc')
+    installer.check_tool('mmdc')
+    assert len(lookups) == len(installer.required_tools) + 1
+
+
+class _FakePopen:
+    def __init__(self, calls, returncode=0, hang=False):
+        self.calls = calls
+        self.returncode = returncode
+        self.hang = hang
+        self.killed = False
+
+    def __call__(self, cmd, **kwargs):
+        self.calls.append(cmd)
+        self.kwargs = kwargs
+        return self
+
+    def wait(self, timeout=None):
+        if self.hang and not self.killed:
+            raise subprocess.TimeoutExpired('cmd', timeout)
+        return -9 if self.killed else self.returncode
+
+    def kill(self):
+        self.killed = True
+
+
+def test_presence_check_does_not_spawn_processes(monkeypatch):
+    calls = []
+    monkeypatch.setattr(install_dependencies.subprocess, 'Popen', _FakePopen(calls))
+    monkeypatch.setattr(install_dependencies.shutil, 'which', lambda name: f"/usr/bin/{name}")
+    installer = install_dependencies.DependencyInstaller()
+
+    assert installer.check_tool('pandoc')
+    assert not installer.check_tool('unknown-tool')
+    assert calls == []
+
+    assert installer.check_tool('pandoc', verify_runs=True)
+    assert calls == [['/usr/bin/pandoc', '--version']]
+
+
+def test_version_check_discards_output(monkeypatch):
+    popen = _FakePopen([])
+    monkeypatch.setattr(install_dependencies.subprocess, 'Popen', popen)
+    monkeypatch.setattr(install_dependencies.shutil, 'which', lambda name: f"/usr/bin/{name}")
+    assert install_dependencies.DependencyInstaller().check_tool('pandoc', verify_runs=True)
+    assert popen.kwargs == {'stdout': subprocess.DEVNULL, 'stderr': subprocess.DEVNULL,
+                            'close_fds': install_dependencies._CLOSE_FDS}
+
+
+@pytest.mark.skipif(not getattr(subprocess, '_USE_POSIX_SPAWN', False),
+                    reason='posix_spawn not used by this Python')
+def test_version_check_uses_posix_spawn(monkeypatch):
+    spawned = []
+    real_spawn = subprocess.Popen._posix_spawn
+
+    def _spawn(self, args, *rest):
+        spawned.append(args)
+        return real_spawn(self, args, *rest)
+
+    monkeypatch.setattr(subprocess.Popen, '_posix_spawn', _spawn)
+    monkeypatch.setattr(install_dependencies.shutil, 'which', lambda name: '/bin/true')
+    assert install_dependencies.DependencyInstaller().check_tool('pandoc', verify_runs=True)
+    assert spawned == [['/bin/true', '--version']]
+
+
+def test_missing_tool_is_not_spawned(monkeypatch):
+    calls = []
+    monkeypatch.setattr(install_dependencies.subprocess, 'Popen', _FakePopen(calls))
+    monkeypatch.setattr(install_dependencies.shutil, 'which', lambda name: None)
+    assert not install_dependencies.DependencyInstaller().check_tool('pandoc', verify_runs=True)
+    assert calls == []
+
+
+def test_hung_version_check_is_killed(monkeypatch):
+    popen = _FakePopen([], hang=True)
+    monkeypatch.setattr(install_dependencies.subprocess, 'Popen', popen)
+    monkeypatch.setattr(install_dependencies.shutil, 'which', lambda name: f"/usr/bin/{name}")
+    assert not install_dependencies.DependencyInstaller().check_tool('mmdc', verify_runs=True)
+    assert popen.killed
+
+
+def test_auto_install_verifies_the_new_tool_runs(monkeypatch, capsys):
+    calls = []
+    monkeypatch.setattr(install_dependencies.subprocess, 'run', _counting_run(calls))
+    monkeypatch.setattr(install_dependencies.subprocess, 'Popen', _FakePopen(calls))
+    monkeypatch.setattr(install_dependencies.shutil, 'which', lambda name: f"/usr/bin/{name}")
+    installer = install_dependencies.DependencyInstaller()
+
+    assert installer.attempt_auto_install('mmdc')
+    assert calls == [['/usr/bin/npm', 'install', '-g', '@mermaid-js/mermaid-cli'],
+                     ['/usr/bin/mmdc', '--version']]
+
+
+def test_verify_runs_all_version_commands_concurrently(monkeypatch, capsys):
+    started = threading.Barrier(2, timeout=5)
+
+    class _Popen:
+        def __init__(self, cmd, **kwargs):
+            self.cmd = cmd
+
+        def wait(self, timeout=None):
+            # Both checks must be in flight at once, or the barrier times out
+            started.wait()
+            return 0 if self.cmd[0] == '/usr/bin/pandoc' else 1
+
+    monkeypatch.setattr(install_dependencies.subprocess, 'Popen', _Popen)
+    monkeypatch.setattr(install_dependencies.shutil, 'which', lambda name: f"/usr/bin/{name}")
+    installer = install_dependencies.DependencyInstaller()
+
+    assert not installer.check_all_dependencies(verify_runs=True)
+    out = capsys.readouterr().out
+    assert out.index('✓ pandoc: Installed') < out.index('✗ mmdc: Not found')
+
+
+def test_linux_distro_is_parsed_once_and_follows_id_like(monkeypatch):
+    reads = []
+    real_open = builtins.open
+    os_release = 'NAME="Linux Mint"\nID=linuxmint\nID_LIKE="ubuntu debian"  # derivative\n'
+
+    def _open(path, *args, **kwargs):
+        if path == "/etc/os-release":
+            reads.append(path)
+            return io.StringIO(os_release)
+        return real_open(path, *args, **kwargs)
+
+    monkeypatch.setattr(builtins, 'open', _open)
+    install_dependencies._read_os_release.cache_clear()
+    try:
+        assert install_dependencies.DependencyInstaller().get_linux_distro() == 'ubuntu'
+        assert install_dependencies.DependencyInstaller().get_linux_distro() == 'ubuntu'
+        assert reads == ["/etc/os-release"]
+
+        install_dependencies._read_os_release.cache_clear()
+        os_release = 'ID="fedora"\n'
+        assert install_dependencies.DependencyInstaller().get_linux_distro() == 'fedora'
+    finally:
+        install_dependencies._read_os_release.cache_clear()
+
+
+def test_required_tools_are_shared_and_read_only():
+    first = install_dependencies.DependencyInstaller()
+    second = install_dependencies.DependencyInstaller()
+    assert first.required_tools is second.required_tools
+    with pytest.raises(TypeError):
+        first.required_tools['extra'] = {}
+
+
+@pytest.mark.parametrize('distro, expected', [
+    ('fedora', ['Linux (fedora): sudo dnf install pandoc',
+                'Linux (general): npm install -g @mermaid-js/mermaid-cli']),
+    ('gentoo', ['Linux (general): sudo apt update && sudo apt install pandoc',
+                'Linux (general): npm install -g @mermaid-js/mermaid-cli']),
+])
+def test_linux_instructions_fall_back_per_tool(monkeypatch, capsys, distro, expected):
+    monkeypatch.setattr(install_dependencies.shutil, 'which', lambda name: None)
+    installer = install_dependencies.DependencyInstaller()
+    installer.system = 'linux'
+    monkeypatch.setattr(installer, 'get_linux_distro', lambda: distro)
+
+    installer.show_installation_instructions()
+    lines = [line for line in capsys.readouterr().out.splitlines() if line.startswith('Linux')]
+    assert lines == expected
+
+
+def test_reports_are_written_in_one_call(tmp_path, monkeypatch):
+    # Only the stubbed lookups count, whatever is installed on this machine
+    monkeypatch.setenv('PATH', str(tmp_path))
+    monkeypatch.setattr(install_dependencies.shutil, 'which', lambda name: None)
+    stdout = io.StringIO()
+    writes = []
+    monkeypatch.setattr(stdout, 'write', lambda text: writes.append(text))
+    monkeypatch.setattr(install_dependencies.sys, 'stdout', stdout)
+    installer = install_dependencies.DependencyInstaller()
+    installer.system = 'darwin'
+
+    installer.check_all_dependencies()
+    # Header first, then the whole per-tool report
+    assert len(writes) == 2
+    assert writes[1].endswith("Missing dependencies: pandoc, mmdc\n")
+
+    writes.clear()
+    installer.show_installation_instructions()
+    assert len(writes) == 1
+    assert "macOS: brew install pandoc" in writes[0]
+
+
+@pytest.mark.parametrize('system, expected', [
+    ('windows', 'Windows: '),
+    ('darwin', 'macOS: '),
+    ('linux', 'Linux ('),
+])
+def test_distro_is_looked_up_once_and_only_on_linux(monkeypatch, capsys, system, expected):
+    monkeypatch.setattr(install_dependencies.shutil, 'which', lambda name: None)
+    installer = install_dependencies.DependencyInstaller()
+    installer.system = system
+    lookups = []
+    monkeypatch.setattr(installer, 'get_linux_distro', lambda: lookups.append(1) or 'ubuntu')
+
+    installer.show_installation_instructions()
+    lines = [line for line in capsys.readouterr().out.splitlines() if line.startswith(expected)]
+    assert len(lines) == len(installer.required_tools)
+    assert len(lookups) == (1 if system == 'linux' else 0)
+
+
+def test_npm_lookup_is_memoized(monkeypatch, capsys):
+    lookups = []
+    monkeypatch.setattr(install_dependencies.subprocess, 'run', _counting_run([], returncode=1))
+    monkeypatch.setattr(install_dependencies.shutil, 'which',
+                        lambda name: lookups.append(name) or f"/usr/bin/{name}")
+    installer = install_dependencies.DependencyInstaller()
+
+    assert not installer.attempt_auto_install('mmdc')
+    assert not installer.attempt_auto_install('mmdc')
+    assert lookups == ['npm']
+
+    installer.invalidate_cache()
+    installer.attempt_auto_install('mmdc')
+    assert lookups == ['npm', 'npm']
+
+
+def test_tools_are_reported_in_table_order(tmp_path, monkeypatch, capsys):
+    # Only the stubbed lookups count, whatever is installed on this machine
+    monkeypatch.setenv('PATH', str(tmp_path))
+    monkeypatch.setattr(install_dependencies.shutil, 'which', lambda name: None)
+    installer = install_dependencies.DependencyInstaller()
+    installer.system = 'darwin'
+    assert install_dependencies._TOOL_ORDER == ('pandoc', 'mmdc')
+
+    installer.check_all_dependencies()
+    installer.show_installation_instructions()
+    out = capsys.readouterr().out
+    assert out.index('✗ pandoc') < out.index('✗ mmdc') < out.index('PANDOC:') < out.index('MMDC:')